@@ -6,10 +6,20 @@ Deployment-ready version with Streamlit secrets support.
 
 import streamlit as st
 import os
+import io
 import json
+import hashlib
+import shutil
+import sys
 import tempfile
-from pathlib import Path
-from typing import Optional, Dict
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, Dict, Callable, Tuple, Mapping
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 
 from drive_api import DriveAPI
 from sheets_api import SheetsAPI
@@ -17,6 +27,66 @@ from media_validator import MediaValidator
 from st_audiorec import st_audiorec
 
 
+# Submission categories offered in the form
+CATEGORIES = (
+    "Urban daily life",
+    "Rural daily life",
+    "Marketplaces",
+    "Food",
+    "Clothing & textiles",
+    "Landscapes & nature",
+    "Transportation",
+    "Public spaces & infrastructure",
+    "Agriculture & livestock",
+    "Local objects & cultural items"
+)
+
+# Per-mode settings: Drive folders (also used as link paths), sheet tab, ID prefix,
+# and the uploader's accepted extensions
+MODE_CONFIG = {
+    'Image': {
+        'media_folder': 'Images',
+        'audio_folder': 'Image_Audio_Transcriptions',
+        'sheet': 'Images',
+        'prefix': 'img_',
+        'exts': ('jpg', 'jpeg', 'png'),
+        'upload_label': "Upload Image",
+        'upload_help': "Supported formats: .jpg, .jpeg, .png"
+    },
+    'Video': {
+        'media_folder': 'Videos',
+        'audio_folder': 'Video_Audio_Transcriptions',
+        'sheet': 'Videos',
+        'prefix': 'vid_',
+        'exts': ('mp4',),
+        'upload_label': "Upload Video",
+        'upload_help': "Supported format: .mp4 (3-10 seconds)"
+    }
+}
+
+
+# Content types for every extension the uploaders accept, so Drive uploads
+# don't fall back to guessing from the global mimetypes database
+MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.mp4': 'video/mp4',
+    '.mp3': 'audio/mpeg',
+    '.wav': 'audio/wav'
+}
+
+
+# How long a submission blocks re-submitting the same form (covers double clicks
+# and refreshes while the upload pipeline is still running)
+SUBMISSION_LOCK_SECONDS = 60
+
+# Number of recent background submissions listed under the form
+MAX_JOBS_SHOWN = 5
+
+IS_WINDOWS = sys.platform.startswith('win')
+
+
 # Page configuration
 st.set_page_config(
     page_title="Sudan-MM Data Collection",
@@ -33,12 +103,20 @@ if 'sheets_api' not in st.session_state:
     st.session_state.sheets_api = None
 if 'folder_structure' not in st.session_state:
     st.session_state.folder_structure = None
+if 'folder_map' not in st.session_state:
+    st.session_state.folder_map = None
 if 'spreadsheet_id' not in st.session_state:
     st.session_state.spreadsheet_id = None
 if 'username' not in st.session_state:
     st.session_state.username = None
 if 'recorded_audio' not in st.session_state:
     st.session_state.recorded_audio = None
+if 'form_nonce' not in st.session_state:
+    st.session_state.form_nonce = uuid.uuid4().hex
+if 'in_flight' not in st.session_state:
+    st.session_state.in_flight = None  # (form_nonce, start time) of the running submission
+if 'submission_jobs' not in st.session_state:
+    st.session_state.submission_jobs = []
 
 
 def load_config() -> Dict:
@@ -62,6 +140,115 @@ def load_config() -> Dict:
         st.stop()
 
 
+# The client factories below are cached per call signature, so always call them
+# positionally as (credentials_path, token_dict) to share one instance per process
+@st.cache_resource(show_spinner=False)
+def get_drive_api(credentials_path: Optional[str] = None, token_dict: Optional[Dict] = None) -> DriveAPI:
+    """Build the Drive API client once per server process and share it across sessions."""
+    if token_dict:
+        drive_api = DriveAPI(token_dict=token_dict)
+    else:
+        drive_api = DriveAPI(credentials_path)
+    # Authenticate now so auth failures surface during initialization
+    drive_api.service
+    return drive_api
+
+
+@st.cache_resource(show_spinner=False)
+def get_sheets_api(credentials_path: Optional[str] = None, token_dict: Optional[Dict] = None) -> SheetsAPI:
+    """Build the Sheets API client once per server process and share it across sessions."""
+    if token_dict:
+        return SheetsAPI(token_dict=token_dict)
+    return SheetsAPI(credentials_path)
+
+
+# Local cache of resolved Drive/Sheets IDs, so restarts skip the folder/spreadsheet lookup
+ID_CACHE_PATH = os.path.join('.cache', 'sudan_mm_ids.json')
+
+
+def _load_id_cache() -> Dict:
+    """Load the persisted ID cache, or an empty cache if missing or unreadable."""
+    try:
+        with open(ID_CACHE_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_id_cache(cache: Dict):
+    """Persist the ID cache; failures are ignored since the cache is only an optimisation."""
+    try:
+        os.makedirs(os.path.dirname(ID_CACHE_PATH), exist_ok=True)
+        with open(ID_CACHE_PATH, 'w') as f:
+            json.dump(cache, f, indent=2)
+    except OSError:
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def get_storage_ids(parent_folder_name: str, parent_folder_id: Optional[str], spreadsheet_name: str,
+                    credentials_path: Optional[str] = None,
+                    token_dict: Optional[Dict] = None) -> Tuple[Dict[str, str], str]:
+    """
+    Resolve the folder structure and spreadsheet ID once per server process.
+    
+    Resolved IDs are persisted to ID_CACHE_PATH. After a restart they are reused
+    once one batched request confirms every cached folder and the spreadsheet still
+    exist; otherwise the full folder/spreadsheet lookup runs again.
+    
+    Returns:
+        Tuple of (folder_structure, spreadsheet_id)
+    """
+    cache_key = f"{parent_folder_name}|{parent_folder_id or ''}|{spreadsheet_name}"
+    cache = _load_id_cache()
+    entry = cache.get(cache_key)
+    
+    if entry:
+        try:
+            drive_api = get_drive_api(credentials_path, token_dict)
+            expected_types = {
+                folder_id: 'application/vnd.google-apps.folder'
+                for folder_id in entry['folder_structure'].values()
+            }
+            expected_types[entry['spreadsheet_id']] = 'application/vnd.google-apps.spreadsheet'
+            accessible = drive_api.verify_files(expected_types)
+            if all(accessible.get(file_id) for file_id in expected_types):
+                return entry['folder_structure'], entry['spreadsheet_id']
+        except Exception:
+            pass  # Stale or unreadable entry: fall back to the full lookup
+    
+    # Resolve the parent folder first; the subfolders and the spreadsheet only
+    # depend on it, so look them up concurrently
+    drive_api = get_drive_api(credentials_path, token_dict)
+    sheets_api = get_sheets_api(credentials_path, token_dict)
+    parent_id = drive_api.resolve_parent_folder(parent_folder_name, parent_folder_id)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        folders_future = executor.submit(drive_api.setup_subfolders, parent_id)
+        spreadsheet_future = executor.submit(
+            sheets_api.get_or_create_spreadsheet,
+            spreadsheet_name,
+            parent_id
+        )
+        folder_structure = folders_future.result()
+        spreadsheet_id = spreadsheet_future.result()
+    
+    cache[cache_key] = {
+        'folder_structure': folder_structure,
+        'spreadsheet_id': spreadsheet_id
+    }
+    _save_id_cache(cache)
+    return folder_structure, spreadsheet_id
+
+
+def to_plain_dict(value):
+    """Recursively convert Streamlit secrets containers into plain dicts and lists."""
+    if isinstance(value, Mapping):
+        return {key: to_plain_dict(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain_dict(item) for item in value]
+    return value
+
+
 def initialize_apis(config: Dict):
     """Initialize Google Drive and Sheets API clients with OAuth."""
     
@@ -78,12 +265,15 @@ def initialize_apis(config: Dict):
     if use_secrets:
         # Deployment mode - use token from secrets
         try:
-            # Deep-convert to plain Python dict (handles Streamlit's AttrDict)
-            token_dict = json.loads(json.dumps(dict(st.secrets['token']), default=str))
+            # Convert Streamlit's AttrDict to a plain dict once per session
+            if '_token_dict' not in st.session_state:
+                st.session_state._token_dict = to_plain_dict(st.secrets['token'])
+            token_dict = st.session_state._token_dict
             
             # Initialize APIs with token only (no oauth_credentials needed on server)
-            drive_api = DriveAPI(token_dict=token_dict)
-            sheets_api = SheetsAPI(token_dict=token_dict)
+            credentials_path = None
+            drive_api = get_drive_api(credentials_path, token_dict)
+            sheets_api = get_sheets_api(credentials_path, token_dict)
             
         except Exception as e:
             st.error(f"Failed to initialize with secrets: {str(e)}")
@@ -112,8 +302,10 @@ def initialize_apis(config: Dict):
         
         try:
             # Initialize APIs with OAuth files
-            drive_api = DriveAPI(oauth_credentials_path)
-            sheets_api = SheetsAPI(oauth_credentials_path)
+            token_dict = None
+            credentials_path = oauth_credentials_path
+            drive_api = get_drive_api(credentials_path, token_dict)
+            sheets_api = get_sheets_api(credentials_path, token_dict)
             
         except Exception as e:
             st.error(f"Failed to initialize APIs: {str(e)}")
@@ -125,31 +317,32 @@ def initialize_apis(config: Dict):
             st.stop()
     
     try:
-        # Set up folder structure
+        # Set up folder structure and get or create spreadsheet
         parent_folder_name = config.get('parent_folder_name', 'Sudan-MM-Submission-Zamanna')
-        parent_folder_id = config.get('parent_folder_id')
-        
-        if parent_folder_id and parent_folder_id.strip():
-            # Use existing folder
-            folder_structure = drive_api.setup_folder_structure(
-                parent_folder_name, 
-                parent_folder_id=parent_folder_id.strip()
-            )
-        else:
-            # Create new folder structure
-            folder_structure = drive_api.setup_folder_structure(parent_folder_name)
-        
-        # Get or create spreadsheet
+        parent_folder_id = (config.get('parent_folder_id') or '').strip() or None
         spreadsheet_name = config.get('spreadsheet_name', 'Sudan-MM-Metadata')
-        spreadsheet_id = sheets_api.get_or_create_spreadsheet(
+        
+        folder_structure, spreadsheet_id = get_storage_ids(
+            parent_folder_name,
+            parent_folder_id,
             spreadsheet_name,
-            folder_structure.get('parent')
+            credentials_path,
+            token_dict
         )
         
         # Store in session state
         st.session_state.drive_api = drive_api
         st.session_state.sheets_api = sheets_api
         st.session_state.folder_structure = folder_structure
+        st.session_state.folder_map = {
+            mode: {
+                'media_path': mode_config['media_folder'],
+                'audio_path': mode_config['audio_folder'],
+                'media_id': folder_structure[mode_config['media_folder']],
+                'audio_id': folder_structure[mode_config['audio_folder']]
+            }
+            for mode, mode_config in MODE_CONFIG.items()
+        }
         st.session_state.spreadsheet_id = spreadsheet_id
         st.session_state.initialized = True
         
@@ -158,34 +351,195 @@ def initialize_apis(config: Dict):
         st.stop()
 
 
-def get_next_id(mode: str) -> str:
-    """Generate the next sequential ID for the given mode."""
-    sheets_api = st.session_state.sheets_api
-    spreadsheet_id = st.session_state.spreadsheet_id
+@st.cache_resource(show_spinner=False)
+def _id_counter() -> Dict:
+    """Process-wide map of (spreadsheet_id, mode) to the last assigned ID number."""
+    return {}
+
+
+@st.cache_resource(show_spinner=False)
+def _id_counter_lock() -> threading.Lock:
+    """Lock guarding the shared ID counter across concurrent sessions."""
+    return threading.Lock()
+
+
+def invalidate_id_counter(sheets_api: SheetsAPI, spreadsheet_id: str, mode: str):
+    """
+    Re-sync the cached ID for a mode with the sheet, never moving it backwards.
+    
+    IDs already handed to in-flight submissions (in this or other sessions) are not
+    in the sheet yet, so the counter only ever rises to the sheet's maximum; an ID
+    whose submission failed is left as a gap rather than reissued.
+    """
+    try:
+        # The sheet is only authoritative once queued rows have been written
+        flush_pending_rows(sheets_api, spreadsheet_id)
+        sheet_max = sheets_api.get_max_id(spreadsheet_id, mode)
+    except Exception:
+        # Keep the counter as is; it is never behind the IDs already issued
+        return
+    counter = _id_counter()
+    key = (spreadsheet_id, mode)
+    with _id_counter_lock():
+        counter[key] = max(counter.get(key, 0), sheet_max)
+
+
+@st.cache_resource(show_spinner=False)
+def _pending_rows() -> Dict:
+    """Process-wide map of sheet name to metadata rows waiting to be written."""
+    return {}
+
+
+@st.cache_resource(show_spinner=False)
+def _pending_rows_lock() -> threading.Lock:
+    """Lock guarding the pending-row queue across concurrent sessions."""
+    return threading.Lock()
+
+
+def count_pending_rows() -> int:
+    """Number of metadata rows queued but not yet written to the spreadsheet."""
+    with _pending_rows_lock():
+        return sum(len(rows) for rows in _pending_rows().values())
+
+
+def flush_pending_rows(sheets_api: SheetsAPI, spreadsheet_id: str) -> int:
+    """
+    Write all queued rows with one append call per sheet tab.
+    
+    Rows are taken off the queue under the lock and written outside it, so other
+    sessions can keep queueing during the Sheets call. If a tab's write fails, its
+    rows go back to the front of that tab's queue, the remaining tabs are still
+    written, and the first error is raised once all tabs were attempted.
+    
+    Returns:
+        Number of rows written
+    """
+    with _pending_rows_lock():
+        pending = _pending_rows()
+        batches = [(sheet_name, rows) for sheet_name, rows in pending.items() if rows]
+        pending.clear()
+    
+    written = 0
+    first_error = None
+    for sheet_name, rows in batches:
+        try:
+            sheets_api.append_rows(spreadsheet_id, sheet_name, rows)
+            written += len(rows)
+        except Exception as e:
+            # Keep the rows ahead of anything queued since, so IDs stay in order
+            with _pending_rows_lock():
+                pending = _pending_rows()
+                pending[sheet_name] = rows + pending.get(sheet_name, [])
+            first_error = first_error or e
+    
+    if first_error is not None:
+        raise first_error
+    return written
+
+
+def queue_row(sheets_api: SheetsAPI, spreadsheet_id: str, sheet_name: str,
+              row_data: list, batch_size: int) -> int:
+    """
+    Queue a metadata row and flush the queue once it holds `batch_size` rows.
     
-    max_id = sheets_api.get_max_id(spreadsheet_id, mode)
-    next_id_num = max_id + 1
+    With the default batch size of 1 every row is written immediately. Larger
+    values trade durability (queued rows are lost if the server restarts) for
+    fewer Sheets API calls.
     
-    prefix = 'img_' if mode == 'Image' else 'vid_'
+    Returns:
+        Number of rows still waiting to be written
+    """
+    with _pending_rows_lock():
+        _pending_rows().setdefault(sheet_name, []).append(row_data)
+    if count_pending_rows() >= batch_size:
+        flush_pending_rows(sheets_api, spreadsheet_id)
+    return count_pending_rows()
+
+
+def release_id(spreadsheet_id: str, mode: str, next_id: str):
+    """Hand back an unused ID, as long as no later ID has been allocated since."""
+    prefix = MODE_CONFIG[mode]['prefix']
+    counter = _id_counter()
+    key = (spreadsheet_id, mode)
+    with _id_counter_lock():
+        if key in counter and next_id == f"{prefix}{counter[key]}":
+            counter[key] -= 1
+
+
+def get_next_id(mode: str, sheets_api: SheetsAPI, spreadsheet_id: str) -> str:
+    """
+    Generate the next sequential ID for the given mode.
+    
+    The sheet is only scanned the first time a mode is used in this process;
+    afterwards the cached counter is incremented locally. Takes the API client
+    explicitly (rather than reading session state) so it can run on a worker thread.
+    """
+    counter = _id_counter()
+    key = (spreadsheet_id, mode)
+    
+    with _id_counter_lock():
+        if key not in counter:
+            counter[key] = sheets_api.get_max_id(spreadsheet_id, mode)
+        counter[key] += 1
+        next_id_num = counter[key]
+    
+    prefix = MODE_CONFIG[mode]['prefix']
     return f"{prefix}{next_id_num}"
 
 
-def save_uploaded_file(uploaded_file, suffix: str = "") -> Optional[str]:
+TMPFS_DIR = '/dev/shm'
+
+
+@st.cache_resource(show_spinner=False)
+def _tmpfs_available() -> bool:
+    """Check once per process whether /dev/shm is a RAM-backed tmpfs mount."""
+    try:
+        with open('/proc/mounts', 'r') as f:
+            return any(
+                line.split()[1] == TMPFS_DIR and line.split()[2] == 'tmpfs'
+                for line in f
+            )
+    except OSError:
+        return False
+
+
+def get_temp_dir(config: Dict, size: int) -> Optional[str]:
+    """
+    Pick the directory for a temporary file of the given size.
+    
+    With `use_tmpfs` enabled in the config, files go to /dev/shm so validation
+    and cleanup never touch the disk. Falls back to the default temp directory
+    when tmpfs is unavailable or has less than twice the file size free.
+    """
+    if not config.get('use_tmpfs') or not _tmpfs_available():
+        return None
+    try:
+        if shutil.disk_usage(TMPFS_DIR).free < 2 * size:
+            return None
+    except OSError:
+        return None
+    return TMPFS_DIR
+
+
+def save_uploaded_file(uploaded_file, suffix: str = "", temp_dir: Optional[str] = None) -> Optional[str]:
     """Save uploaded file to temporary location."""
     try:
-        suffix = suffix or Path(uploaded_file.name).suffix
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-            tmp_file.write(uploaded_file.getbuffer())
-            return tmp_file.name
+        suffix = suffix or os.path.splitext(uploaded_file.name)[1]
+        uploaded_file.seek(0)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=temp_dir) as tmp_file:
+            # Copy in 1 MB chunks instead of materialising the whole buffer at once
+            shutil.copyfileobj(uploaded_file, tmp_file, length=1024 * 1024)
+        uploaded_file.seek(0)
+        return tmp_file.name
     except Exception as e:
         st.error(f"Error saving file: {str(e)}")
         return None
 
 
-def save_bytes_to_temp(data: bytes, suffix: str = ".wav") -> Optional[str]:
+def save_bytes_to_temp(data: bytes, suffix: str = ".wav", temp_dir: Optional[str] = None) -> Optional[str]:
     """Save raw bytes to a temporary file."""
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=temp_dir) as tmp_file:
             tmp_file.write(data)
             return tmp_file.name
     except Exception as e:
@@ -204,25 +558,27 @@ def safe_delete_file(file_path: str, max_retries: int = 3) -> bool:
     Returns:
         True if deleted successfully, False otherwise
     """
-    if not file_path or not os.path.exists(file_path):
+    if not file_path:
         return True
     
-    import time
     import gc
     
     for attempt in range(max_retries):
         try:
-            # Force garbage collection to close any open file handles
-            gc.collect()
-            time.sleep(0.1)  # Small delay to allow file handles to close
             os.unlink(file_path)
             return True
+        except FileNotFoundError:
+            return True
         except PermissionError:
-            if attempt < max_retries - 1:
-                time.sleep(0.5)  # Wait longer before retry
+            # Windows refuses to delete files with open handles; collect any
+            # unreferenced file objects and give the OS a moment before retrying.
+            # On POSIX unlink ignores open handles, so the error won't go away
+            if IS_WINDOWS and attempt < max_retries - 1:
+                gc.collect()
+                time.sleep(0.5)
                 continue
             # Last attempt failed, log but don't crash
-            print(f"Warning: Could not delete temporary file {file_path} after {max_retries} attempts")
+            print(f"Warning: Could not delete temporary file {file_path} after {attempt + 1} attempts")
             return False
         except Exception as e:
             print(f"Warning: Error deleting file {file_path}: {str(e)}")
@@ -231,6 +587,226 @@ def safe_delete_file(file_path: str, max_retries: int = 3) -> bool:
     return False
 
 
+@st.cache_resource(show_spinner=False)
+def get_validator() -> MediaValidator:
+    """Share one stateless MediaValidator across all sessions and submissions."""
+    return MediaValidator()
+
+
+def validate_media(validator: MediaValidator, file_name: str, file_path: Optional[str], mode: str) -> Optional[str]:
+    """
+    Validate the media file format and, for videos, its duration.
+    
+    Args:
+        validator: MediaValidator instance
+        file_name: Original name of the uploaded file
+        file_path: Local copy of the file (only needed for videos)
+        mode: Either 'Image' or 'Video'
+    
+    Returns:
+        Error message to display, or None if the file is valid
+    """
+    is_valid, error_msg = validator.validate_media_extension(file_name, mode.lower())
+    if not is_valid:
+        return f"Media validation error: {error_msg}"
+    
+    if mode == "Video":
+        is_valid, error_msg, _ = validator.validate_video_duration(
+            file_path,
+            min_seconds=3.0,
+            max_seconds=10.0
+        )
+        if not is_valid:
+            return f"Video validation error: {error_msg}"
+    
+    return None
+
+
+def validate_audio(validator: MediaValidator, file_path: str, check_format: bool) -> Optional[str]:
+    """
+    Validate the audio caption format (uploads only) and its duration.
+    
+    Returns:
+        Error message to display, or None if the file is valid
+    """
+    if check_format:
+        # Name-only check; a missing file is caught when the duration is read
+        is_valid, error_msg = validator.validate_audio_extension(file_path)
+        if not is_valid:
+            return f"Audio validation error: {error_msg}"
+    
+    is_valid, error_msg, _ = validator.validate_audio_duration(
+        file_path,
+        min_seconds=5.0,
+        max_seconds=15.0
+    )
+    if not is_valid:
+        return f"Audio validation error: {error_msg}"
+    
+    return None
+
+
+@st.cache_resource(show_spinner=False)
+def _uploaded_files() -> Dict:
+    """Process-wide map of (folder_id, sha256) to the Drive file already holding those bytes."""
+    return {}
+
+
+def upload_deduplicated(drive_api: DriveAPI, uploaded_files: Dict, file_obj, file_name: str,
+                        folder_id: str, progress_callback: Callable[[float], None],
+                        nonce: str) -> Dict:
+    """
+    Upload a file unless identical bytes were already uploaded to the same folder.
+    
+    Args:
+        drive_api: Drive API client
+        uploaded_files: Cache from _uploaded_files() (passed in so this can run on a worker thread)
+        file_obj: In-memory file object (UploadedFile or BytesIO)
+        file_name: Name to use for the file in Drive
+        folder_id: ID of the folder to upload to
+        progress_callback: Callable receiving the fraction uploaded (0.0-1.0)
+        nonce: Idempotency key of the submission, stored on the Drive file
+        
+    Returns:
+        Dictionary with the Drive file 'id' and 'name' (the existing file on a duplicate)
+    """
+    digest = hashlib.sha256(file_obj.getbuffer()).hexdigest()
+    key = (folder_id, digest)
+    
+    if key in uploaded_files:
+        progress_callback(1.0)
+        return uploaded_files[key]
+    
+    file_info = drive_api.upload_stream(
+        file_obj,
+        file_name,
+        folder_id,
+        mime_type=MIME_TYPES.get(os.path.splitext(file_name)[1].lower()),
+        progress_callback=progress_callback,
+        app_properties={'sha256': digest, 'nonce': nonce}
+    )
+    uploaded_files[key] = {'id': file_info['id'], 'name': file_name}
+    return uploaded_files[key]
+
+
+def run_submission_job(job: Dict, drive_api: DriveAPI, sheets_api: SheetsAPI, spreadsheet_id: str,
+                       uploaded_files: Dict, batch_size: int):
+    """
+    Upload a validated submission to Drive and record its metadata row.
+    
+    Runs on a background thread, so it never calls Streamlit UI functions: progress
+    and the outcome are reported by updating `job`, which render_submission_jobs polls.
+    """
+    try:
+        drive_api.ensure_fresh_token()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            media_future = executor.submit(
+                upload_deduplicated,
+                drive_api,
+                uploaded_files,
+                job['media_source'],
+                job['media_name'],
+                job['media_folder_id'],
+                partial(job['progress'].__setitem__, 'media'),
+                job['nonce']
+            )
+            audio_future = executor.submit(
+                upload_deduplicated,
+                drive_api,
+                uploaded_files,
+                job['audio_source'],
+                job['audio_name'],
+                job['audio_folder_id'],
+                partial(job['progress'].__setitem__, 'audio'),
+                job['nonce']
+            )
+            media_file_info = media_future.result()
+            audio_file_info = audio_future.result()
+        
+        # Duplicates link to the previously uploaded file
+        job['media_name'] = media_file_info['name']
+        job['audio_name'] = audio_file_info['name']
+        
+        row_data = [
+            job['id'],
+            f"{job['media_folder']}/{job['media_name']}",
+            job['msa_caption'],
+            job['sudanese_caption'],
+            f"{job['audio_folder']}/{job['audio_name']}",
+            job['category'],
+            job['username']
+        ]
+        try:
+            job['pending_count'] = queue_row(sheets_api, spreadsheet_id, job['sheet'], row_data, batch_size)
+        except Exception as e:
+            # A failed flush puts its rows back in the queue, so the row is still written
+            # by the next flush: report it as queued rather than failed, keeping the ID
+            job['pending_count'] = count_pending_rows()
+            job['warning'] = f"Writing to the spreadsheet failed and will be retried: {str(e)}"
+        job['status'] = 'done'
+    except Exception as e:
+        job['error'] = str(e)
+        job['status'] = 'error'
+        # Leave the counter alone: later IDs may already belong to other running
+        # jobs, so this job's ID simply stays unused
+    finally:
+        # Release the upload buffers so finished jobs do not pin file contents in memory
+        job.pop('media_source', None)
+        job.pop('audio_source', None)
+
+
+def render_submission_jobs():
+    """Show the status of this session's background submissions, refreshing every second while any is running."""
+    polling = any(job['status'] == 'running' for job in st.session_state.submission_jobs)
+    st.fragment(_render_submission_jobs, run_every=1 if polling else None)(polling)
+
+
+def _render_submission_jobs(polling: bool):
+    """Fragment body of render_submission_jobs; `polling` is whether it was set to refresh."""
+    jobs = st.session_state.submission_jobs
+    if polling and not any(job['status'] == 'running' for job in jobs):
+        # The last job finished: rerun the whole app once so the fragment stops polling
+        st.rerun()
+    for job in reversed(jobs):
+        if job['status'] == 'running':
+            st.progress(
+                sum(job['progress'].values()) / 2,
+                text=f"Uploading {job['id']}..."
+            )
+        elif job['status'] == 'error':
+            st.error(f"Error processing submission {job['id']}: {job['error']}")
+        else:
+            st.success(f"✅ Successfully uploaded {job['id']}!")
+            if job.get('warning'):
+                st.warning(job['warning'])
+            if job['pending_count']:
+                st.info(f"{job['pending_count']} submission(s) queued for the next spreadsheet write.")
+            if not job.get('celebrated'):
+                st.balloons()
+                job['celebrated'] = True
+            
+            # Display summary
+            with st.expander(f"View Submission Details ({job['id']})", expanded=job is jobs[-1]):
+                st.write(f"**ID:** {job['id']}")
+                st.write(f"**Uploaded by:** {job['username']}")
+                st.write(f"**Mode:** {job['mode']}")
+                st.write(f"**Media File:** {job['media_name']}")
+                st.write(f"**Audio File:** {job['audio_name']}")
+                st.write(f"**Category:** {job['category']}")
+                st.write(f"**MSA Caption:** {job['msa_caption']}")
+                st.write(f"**Sudanese Caption:** {job['sudanese_caption']}")
+
+
+def is_submission_in_flight() -> bool:
+    """Whether the current form was already submitted and is still being processed."""
+    in_flight = st.session_state.in_flight
+    return (
+        in_flight is not None
+        and in_flight[0] == st.session_state.form_nonce
+        and time.time() - in_flight[1] < SUBMISSION_LOCK_SECONDS
+    )
+
+
 def main():
     """Main application function."""
     st.title("📸 Sudan-MM Data Collection Dashboard")
@@ -315,18 +891,12 @@ def main():
     # --- Main Submission Form ---
     with st.form("submission_form", clear_on_submit=True):
         # Media file upload
-        if mode == "Image":
-            media_file = st.file_uploader(
-                "Upload Image",
-                type=['jpg', 'jpeg', 'png'],
-                help="Supported formats: .jpg, .jpeg, .png"
-            )
-        else:
-            media_file = st.file_uploader(
-                "Upload Video",
-                type=['mp4'],
-                help="Supported format: .mp4 (3-10 seconds)"
-            )
+        mode_config = MODE_CONFIG[mode]
+        media_file = st.file_uploader(
+            mode_config['upload_label'],
+            type=list(mode_config['exts']),
+            help=mode_config['upload_help']
+        )
         
         # Audio file upload (only shown if upload method is selected)
         if audio_method == "Upload file":
@@ -352,28 +922,23 @@ def main():
         )
         
         # Category dropdown
-        categories = [
-            "Urban daily life",
-            "Rural daily life",
-            "Marketplaces",
-            "Food",
-            "Clothing & textiles",
-            "Landscapes & nature",
-            "Transportation",
-            "Public spaces & infrastructure",
-            "Agriculture & livestock",
-            "Local objects & cultural items"
-        ]
         category = st.selectbox(
             "Category",
-            categories,
+            CATEGORIES,
             help="Select the appropriate category for this submission"
         )
         
         # Submit button
         submitted = st.form_submit_button("Submit", use_container_width=True)
         
-        if submitted:
+        if submitted and is_submission_in_flight():
+            # Checked before the field validation: the form clears on submit, so a repeated
+            # click would otherwise only show "required" errors
+            st.warning(
+                "This submission is already being processed. "
+                "If it was interrupted, please try again in a minute."
+            )
+        elif submitted:
             # Determine audio source
             has_recorded = st.session_state.recorded_audio is not None
             has_uploaded = audio_file is not None
@@ -399,159 +964,171 @@ def main():
                 for error in errors:
                     st.error(error)
             else:
-                # Process submission
-                with st.spinner("Processing submission..."):
+                # Process submission; temp files are removed when the block exits
+                nonce = st.session_state.form_nonce
+                st.session_state.in_flight = (nonce, time.time())
+                handed_off = False
+                with st.spinner("Processing submission..."), ExitStack() as cleanup:
                     try:
-                        # Save media file temporarily
-                        media_ext = Path(media_file.name).suffix
-                        media_temp_path = save_uploaded_file(media_file, media_ext)
+                        # Save videos temporarily for ffprobe; images are only checked
+                        # by name and uploaded from memory, so they never touch disk
+                        media_ext = os.path.splitext(media_file.name)[1].lower()
+                        media_temp_path = None
+                        if mode == "Video":
+                            media_temp_path = save_uploaded_file(
+                                media_file,
+                                media_ext,
+                                get_temp_dir(config, media_file.size)
+                            )
+                            if media_temp_path:
+                                cleanup.callback(safe_delete_file, media_temp_path)
                         
                         # Save audio file temporarily (from recording or upload)
                         if audio_method == "Record in app" and has_recorded:
                             audio_ext = ".wav"
                             audio_temp_path = save_bytes_to_temp(
-                                st.session_state.recorded_audio, ".wav"
+                                st.session_state.recorded_audio,
+                                ".wav",
+                                get_temp_dir(config, len(st.session_state.recorded_audio))
                             )
                         else:
                             audio_ext = ".mp3"
-                            audio_temp_path = save_uploaded_file(audio_file, '.mp3')
+                            audio_temp_path = save_uploaded_file(
+                                audio_file,
+                                '.mp3',
+                                get_temp_dir(config, audio_file.size)
+                            )
+                        if audio_temp_path:
+                            cleanup.callback(safe_delete_file, audio_temp_path)
                         
-                        if not media_temp_path or not audio_temp_path:
+                        if (mode == "Video" and not media_temp_path) or not audio_temp_path:
                             st.error("Failed to save uploaded files")
                             return
                         
-                        # Validate media file format
-                        validator = MediaValidator()
-                        is_valid, error_msg = validator.validate_media_file(
-                            media_temp_path,
-                            mode.lower()
-                        )
-                        if not is_valid:
-                            st.error(f"Media validation error: {error_msg}")
-                            safe_delete_file(media_temp_path)
-                            safe_delete_file(audio_temp_path)
-                            return
-                        
-                        # Validate audio file format (skip for in-app recordings)
-                        if audio_method == "Upload file":
-                            is_valid, error_msg = validator.validate_audio_file(
-                                audio_temp_path
+                        # Validate media and audio files concurrently, and allocate
+                        # the next ID (a Sheets read on first use) alongside them
+                        validator = get_validator()
+                        sheets_api = st.session_state.sheets_api
+                        spreadsheet_id = st.session_state.spreadsheet_id
+                        with ThreadPoolExecutor(max_workers=3) as executor:
+                            id_future = executor.submit(
+                                get_next_id, mode, sheets_api, spreadsheet_id
                             )
-                            if not is_valid:
-                                st.error(f"Audio validation error: {error_msg}")
-                                safe_delete_file(media_temp_path)
-                                safe_delete_file(audio_temp_path)
-                                return
-                        
-                        # Validate video duration
-                        if mode == "Video":
-                            is_valid, error_msg, duration = validator.validate_video_duration(
+                            media_future = executor.submit(
+                                validate_media,
+                                validator,
+                                media_file.name,
                                 media_temp_path,
-                                min_seconds=3.0,
-                                max_seconds=10.0
+                                mode
                             )
-                            if not is_valid:
-                                st.error(f"Video validation error: {error_msg}")
-                                safe_delete_file(media_temp_path)
-                                safe_delete_file(audio_temp_path)
-                                return
+                            audio_future = executor.submit(
+                                validate_audio,
+                                validator,
+                                audio_temp_path,
+                                audio_method == "Upload file"
+                            )
+                            error_msg = media_future.result() or audio_future.result()
+                            next_id = id_future.result()
                         
-                        # Validate audio duration
-                        is_valid, error_msg, duration = validator.validate_audio_duration(
-                            audio_temp_path,
-                            min_seconds=5.0,
-                            max_seconds=15.0
-                        )
-                        if not is_valid:
-                            st.error(f"Audio validation error: {error_msg}")
-                            safe_delete_file(media_temp_path)
-                            safe_delete_file(audio_temp_path)
+                        if error_msg:
+                            st.error(error_msg)
+                            release_id(spreadsheet_id, mode, next_id)
                             return
                         
-                        # Generate next ID
-                        next_id = get_next_id(mode)
-                        
                         # Rename files with ID
                         media_new_name = f"{next_id}{media_ext}"
                         audio_new_name = f"{next_id}{audio_ext}"
                         
-                        # Determine target folders
-                        if mode == "Image":
-                            media_folder_id = st.session_state.folder_structure['Images']
-                            audio_folder_id = st.session_state.folder_structure['Image_Audio_Transcriptions']
-                            media_folder_path = "Images"
-                            audio_folder_path = "Image_Audio_Transcriptions"
-                        else:
-                            media_folder_id = st.session_state.folder_structure['Videos']
-                            audio_folder_id = st.session_state.folder_structure['Video_Audio_Transcriptions']
-                            media_folder_path = "Videos"
-                            audio_folder_path = "Video_Audio_Transcriptions"
-                        
-                        # Upload files to Google Drive
-                        drive_api = st.session_state.drive_api
+                        # Target folders, resolved once per session in initialize_apis
+                        folders = st.session_state.folder_map[mode]
+                        media_folder_path = folders['media_path']
+                        audio_folder_path = folders['audio_path']
+                        media_folder_id = folders['media_id']
+                        audio_folder_id = folders['audio_id']
                         
-                        media_file_info = drive_api.upload_file(
-                            media_temp_path,
-                            media_new_name,
-                            media_folder_id
-                        )
+                        # Upload and record the submission on a background thread so the
+                        # form is free for the next submission; uploads stream from the
+                        # in-memory buffers rather than re-reading the temp files
+                        if audio_method == "Record in app":
+                            audio_source = io.BytesIO(st.session_state.recorded_audio)
+                        else:
+                            audio_source = audio_file
                         
-                        audio_file_info = drive_api.upload_file(
-                            audio_temp_path,
-                            audio_new_name,
-                            audio_folder_id
+                        job = {
+                            'id': next_id,
+                            'mode': mode,
+                            'nonce': nonce,
+                            'status': 'running',
+                            'progress': {'media': 0.0, 'audio': 0.0},
+                            'media_source': media_file,
+                            'audio_source': audio_source,
+                            'media_name': media_new_name,
+                            'audio_name': audio_new_name,
+                            'media_folder': media_folder_path,
+                            'audio_folder': audio_folder_path,
+                            'media_folder_id': media_folder_id,
+                            'audio_folder_id': audio_folder_id,
+                            'sheet': mode_config['sheet'],
+                            'msa_caption': msa_caption.strip(),
+                            'sudanese_caption': sudanese_caption.strip(),
+                            'category': category,
+                            'username': st.session_state.username
+                        }
+                        worker = threading.Thread(
+                            target=run_submission_job,
+                            args=(
+                                job,
+                                st.session_state.drive_api,
+                                sheets_api,
+                                spreadsheet_id,
+                                _uploaded_files(),
+                                int(config.get('sheet_batch_size', 1))
+                            ),
+                            daemon=True
                         )
+                        add_script_run_ctx(worker)
+                        worker.start()
+                        handed_off = True
                         
-                        # Prepare metadata row
-                        file_link = f"{media_folder_path}/{media_new_name}"
-                        audio_file_link = f"{audio_folder_path}/{audio_new_name}"
-                        
-                        row_data = [
-                            next_id,
-                            file_link,
-                            msa_caption.strip(),
-                            sudanese_caption.strip(),
-                            audio_file_link,
-                            category,
-                            st.session_state.username
-                        ]
-                        
-                        # Append to spreadsheet
-                        sheets_api = st.session_state.sheets_api
-                        spreadsheet_id = st.session_state.spreadsheet_id
-                        sheet_name = 'Images' if mode == 'Image' else 'Videos'
-                        
-                        sheets_api.append_row(spreadsheet_id, sheet_name, row_data)
+                        jobs = st.session_state.submission_jobs
+                        jobs.append(job)
+                        del jobs[:-MAX_JOBS_SHOWN]
                         
-                        # Clean up temporary files
-                        safe_delete_file(media_temp_path)
-                        safe_delete_file(audio_temp_path)
-                        
-                        # Clear recorded audio after successful submission
+                        # Clear recorded audio and start a fresh idempotency key
                         st.session_state.recorded_audio = None
-                        
-                        # Success message
-                        st.success(f"✅ Successfully uploaded {next_id}!")
-                        st.balloons()
-                        
-                        # Display summary
-                        with st.expander("View Submission Details", expanded=True):
-                            st.write(f"**ID:** {next_id}")
-                            st.write(f"**Uploaded by:** {st.session_state.username}")
-                            st.write(f"**Mode:** {mode}")
-                            st.write(f"**Media File:** {media_new_name}")
-                            st.write(f"**Audio File:** {audio_new_name}")
-                            st.write(f"**Category:** {category}")
-                            st.write(f"**MSA Caption:** {msa_caption.strip()}")
-                            st.write(f"**Sudanese Caption:** {sudanese_caption.strip()}")
+                        st.session_state.form_nonce = uuid.uuid4().hex
                         
                     except Exception as e:
                         st.error(f"Error processing submission: {str(e)}")
-                        # Clean up temp files if they exist
-                        if 'media_temp_path' in locals():
-                            safe_delete_file(media_temp_path)
-                        if 'audio_temp_path' in locals():
-                            safe_delete_file(audio_temp_path)
+                        # Catch up with the sheet if it is ahead; the counter never moves
+                        # back, so IDs held by running jobs are not reissued
+                        invalidate_id_counter(
+                            st.session_state.sheets_api,
+                            st.session_state.spreadsheet_id,
+                            mode
+                        )
+                    finally:
+                        # Unlock the form unless a job took over the submission, including
+                        # when a rerun or stop interrupts this run
+                        if not handed_off:
+                            st.session_state.in_flight = None
+    
+    # Progress and results of background submissions
+    render_submission_jobs()
+    
+    # Write queued metadata rows on demand (only relevant when sheet_batch_size > 1)
+    pending_count = count_pending_rows()
+    if pending_count:
+        st.caption(f"📝 {pending_count} submission(s) waiting to be saved to the spreadsheet")
+        if st.button("Save pending rows", use_container_width=True):
+            try:
+                written = flush_pending_rows(
+                    st.session_state.sheets_api,
+                    st.session_state.spreadsheet_id
+                )
+                st.success(f"✅ Saved {written} row(s) to the spreadsheet")
+            except Exception as e:
+                st.error(f"Error saving rows: {str(e)}")
 
 
 if __name__ == "__main__":
@@ -4,17 +4,32 @@ Handles authentication, folder creation, and file uploads.
 Works with both local token files and Streamlit secrets.
 """
 
+import io
 import os
 import json
-import pickle
 import base64
-from typing import Optional, Dict
+import mimetypes
+import threading
+from datetime import timedelta
+from typing import Optional, Dict, IO, Callable, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from google.auth import _helpers as auth_helpers
 from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import HttpRequest, MediaIoBaseUpload
 from googleapiclient.errors import HttpError
 
+from google_api_utils import (
+    MAX_RETRIES,
+    ThreadLocalHttp,
+    build_service,
+    escape_query_value,
+    execute_with_retry,
+    load_credentials,
+    save_credentials
+)
+
 
 class DriveAPI:
     """Wrapper class for Google Drive API operations using OAuth."""
@@ -24,7 +39,19 @@ class DriveAPI:
         'https://www.googleapis.com/auth/spreadsheets'
     ]
     
-    def __init__(self, credentials_path: str = None, token_path: str = 'token.pickle', 
+    # Chunk size for resumable uploads (must be a multiple of 256 KB)
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+    
+    # Files up to this size go in a single multipart request; a resumable upload
+    # costs an extra session-initiation round trip that only pays off for large files
+    RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+    
+    # Authenticated (credentials, http_pool, service) per auth configuration, shared
+    # by every instance built with the same settings
+    _service_cache: Dict = {}
+    _service_lock = threading.Lock()
+    
+    def __init__(self, credentials_path: str = None, token_path: str = 'token.json', 
                  credentials_dict: Dict = None, token_dict: Dict = None):
         """
         Initialize Drive API client with OAuth.
@@ -39,7 +66,31 @@ class DriveAPI:
         self.token_path = token_path
         self.credentials_dict = credentials_dict
         self.token_dict = token_dict
-        self.service = self._authenticate()
+        self.credentials = None
+        self.http_pool = None
+        self._folder_cache = {}  # (parent_id, folder_name) -> folder ID
+        self._structure_cache = {}  # (parent_folder_name, parent_folder_id) -> folder IDs
+        self._service = None
+    
+    @property
+    def service(self):
+        """Drive service object, authenticated on first use."""
+        if self._service is None:
+            key = (
+                self.credentials_path,
+                self.token_path,
+                json.dumps(self.credentials_dict, sort_keys=True, default=str),
+                json.dumps(self.token_dict, sort_keys=True, default=str),
+                tuple(self.SCOPES)
+            )
+            with DriveAPI._service_lock:
+                cached = DriveAPI._service_cache.get(key)
+                if cached is None:
+                    service = self._authenticate()
+                    cached = (self.credentials, self.http_pool, service)
+                    DriveAPI._service_cache[key] = cached
+            self.credentials, self.http_pool, self._service = cached
+        return self._service
     
     def _authenticate(self):
         """Authenticate using OAuth and return Drive service object."""
@@ -49,15 +100,13 @@ class DriveAPI:
         if self.token_dict:
             try:
                 # Token provided as dict from Streamlit secrets
-                from google.oauth2.credentials import Credentials
                 creds = Credentials.from_authorized_user_info(self.token_dict, self.SCOPES)
             except Exception as e:
                 raise Exception(f"Failed to load credentials from secrets: {str(e)}")
         # Try loading from file (local development)
-        elif os.path.exists(self.token_path):
+        elif self.token_path:
             try:
-                with open(self.token_path, 'rb') as token:
-                    creds = pickle.load(token)
+                creds = load_credentials(self.token_path, self.SCOPES)
             except Exception as e:
                 raise Exception(f"Failed to load token from file: {str(e)}")
         
@@ -68,8 +117,7 @@ class DriveAPI:
                     creds.refresh(Request())
                     # Save refreshed token
                     if self.token_path and not self.token_dict:
-                        with open(self.token_path, 'wb') as token:
-                            pickle.dump(creds, token)
+                        save_credentials(creds, self.token_path)
                 except Exception as e:
                     # If refresh fails in deployment, raise clear error with details
                     if self.token_dict:
@@ -98,13 +146,7 @@ class DriveAPI:
                 
                 try:
                     if self.credentials_dict:
-                        # Create temp file from credentials dict
-                        import tempfile
-                        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-                            json.dump(self.credentials_dict, f)
-                            temp_creds_path = f.name
-                        flow = InstalledAppFlow.from_client_secrets_file(temp_creds_path, self.SCOPES)
-                        os.unlink(temp_creds_path)
+                        flow = InstalledAppFlow.from_client_config(self.credentials_dict, self.SCOPES)
                     else:
                         flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.SCOPES)
                     
@@ -121,10 +163,37 @@ class DriveAPI:
                 
                 # Save credentials for next run
                 if self.token_path:
-                    with open(self.token_path, 'wb') as token:
-                        pickle.dump(creds, token)
+                    save_credentials(creds, self.token_path)
         
-        return build('drive', 'v3', credentials=creds)
+        self.credentials = creds
+        self.http_pool = ThreadLocalHttp(creds)
+        return build_service('drive', 'v3', creds, self.http_pool)
+    
+    def ensure_fresh_token(self, skew_seconds: int = 300):
+        """
+        Refresh the access token if it expires within `skew_seconds`.
+        
+        Called before fanning out concurrent uploads, so a token expiring mid-batch
+        is refreshed once up front instead of by every worker thread at once.
+        
+        Args:
+            skew_seconds: Refresh when fewer than this many seconds of validity remain
+        """
+        self.service  # Authenticate first if this client hasn't been used yet
+        creds = self.credentials
+        if not creds or not creds.refresh_token or not creds.expiry:
+            return
+        
+        with DriveAPI._service_lock:
+            # creds.expiry is a naive UTC datetime; compare it the way google-auth does
+            if creds.expiry - auth_helpers.utcnow() > timedelta(seconds=skew_seconds):
+                return
+            try:
+                creds.refresh(Request())
+            except Exception as e:
+                raise Exception(f"Failed to refresh access token: {str(e)}")
+            if self.token_path and not self.token_dict:
+                save_credentials(creds, self.token_path)
     
     def find_folder_by_name(self, folder_name: str, parent_id: Optional[str] = None) -> Optional[str]:
         """
@@ -137,19 +206,30 @@ class DriveAPI:
         Returns:
             Folder ID if found, None otherwise
         """
-        query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        # Folder IDs don't change, so found folders are remembered for the client's lifetime
+        cache_key = (parent_id, folder_name)
+        if cache_key in self._folder_cache:
+            return self._folder_cache[cache_key]
+        
+        query = (
+            f"name='{escape_query_value(folder_name)}' "
+            f"and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        )
         if parent_id:
-            query += f" and '{parent_id}' in parents"
+            query += f" and '{escape_query_value(parent_id)}' in parents"
         
         try:
-            results = self.service.files().list(
+            request = self.service.files().list(
                 q=query,
                 fields="files(id, name)",
-                spaces='drive'
-            ).execute()
+                spaces='drive',
+                pageSize=1
+            )
+            results = execute_with_retry(request)
             
             folders = results.get('files', [])
             if folders:
+                self._folder_cache[cache_key] = folders[0]['id']
                 return folders[0]['id']
             return None
         except HttpError as e:
@@ -175,14 +255,56 @@ class DriveAPI:
             file_metadata['parents'] = [parent_id]
         
         try:
-            folder = self.service.files().create(
+            request = self.service.files().create(
                 body=file_metadata,
                 fields='id'
-            ).execute()
+            )
+            folder = execute_with_retry(request, idempotent=False)
+            self._folder_cache[(parent_id, folder_name)] = folder.get('id')
             return folder.get('id')
         except HttpError as e:
             raise Exception(f"Error creating folder '{folder_name}': {str(e)}")
     
+    def invalidate_folder_cache(self):
+        """Forget all remembered folder IDs (e.g. after folders were moved or deleted)."""
+        self._folder_cache.clear()
+    
+    def list_child_folders(self, parent_id: str) -> Dict[str, str]:
+        """
+        List all folders directly inside a parent folder in a single request.
+        
+        Args:
+            parent_id: ID of the parent folder
+            
+        Returns:
+            Dictionary mapping folder names to their IDs
+        """
+        query = f"'{escape_query_value(parent_id)}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        
+        try:
+            folders = {}
+            page_token = None
+            while True:
+                request = self.service.files().list(
+                    q=query,
+                    fields="nextPageToken, files(id, name)",
+                    spaces='drive',
+                    pageSize=100,
+                    pageToken=page_token
+                )
+                results = execute_with_retry(request)
+                
+                for folder in results.get('files', []):
+                    # Keep the first match, like find_folder_by_name
+                    folder_id = folders.setdefault(folder['name'], folder['id'])
+                    self._folder_cache[(parent_id, folder['name'])] = folder_id
+                
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    return folders
+        except HttpError as e:
+            raise Exception(f"Error listing folders: {str(e)}")
+    
     def get_or_create_folder(self, folder_name: str, parent_id: Optional[str] = None) -> str:
         """
         Get existing folder or create if it doesn't exist.
@@ -199,7 +321,40 @@ class DriveAPI:
             return folder_id
         return self.create_folder(folder_name, parent_id)
     
-    def upload_file(self, file_path: str, file_name: str, folder_id: str, mime_type: Optional[str] = None) -> Dict:
+    @staticmethod
+    def _execute_upload(request: HttpRequest,
+                        progress_callback: Optional[Callable[[float], None]] = None) -> Dict:
+        """
+        Send an upload request, chunk by chunk if it is resumable.
+        
+        Args:
+            request: files().create request with a media body
+            progress_callback: Optional callable receiving the fraction uploaded (0.0-1.0)
+            
+        Returns:
+            Response of the final request
+        """
+        if request.resumable is None:
+            # Single-shot multipart upload; a retried 5xx can at worst leave a
+            # duplicate file, which beats failing the whole submission
+            response = execute_with_retry(request)
+            if progress_callback:
+                progress_callback(1.0)
+            return response
+        
+        # next_chunk retries transient errors itself and resumes from the last
+        # acknowledged byte instead of restarting the upload
+        response = None
+        while response is None:
+            status, response = request.next_chunk(num_retries=MAX_RETRIES)
+            if status and progress_callback:
+                progress_callback(status.progress())
+        if progress_callback:
+            progress_callback(1.0)
+        return response
+    
+    def upload_file(self, file_path: str, file_name: str, folder_id: str, mime_type: Optional[str] = None,
+                    progress_callback: Optional[Callable[[float], None]] = None) -> Dict:
         """
         Upload a file to Google Drive.
         
@@ -208,27 +363,96 @@ class DriveAPI:
             file_name: Name to use for the file in Drive
             folder_id: ID of the folder to upload to
             mime_type: Optional MIME type (auto-detected if not provided)
+            progress_callback: Optional callable receiving the fraction uploaded (0.0-1.0)
             
         Returns:
-            Dictionary with file information including 'id' and 'name'
+            Dictionary with the uploaded file's 'id'
+        """
+        with open(file_path, 'rb') as file_obj:
+            return self.upload_stream(
+                file_obj,
+                file_name,
+                folder_id,
+                mime_type=mime_type or mimetypes.guess_type(file_path)[0],
+                progress_callback=progress_callback
+            )
+    
+    def upload_stream(self, file_obj: Union[bytes, IO[bytes]], file_name: str, folder_id: str,
+                      mime_type: Optional[str] = None,
+                      progress_callback: Optional[Callable[[float], None]] = None,
+                      app_properties: Optional[Dict[str, str]] = None) -> Dict:
+        """
+        Upload bytes or a file object to Google Drive without writing it to disk.
+        
+        Args:
+            file_obj: Raw bytes or a readable, seekable binary file object
+                (e.g. a Streamlit UploadedFile or BytesIO)
+            file_name: Name to use for the file in Drive
+            folder_id: ID of the folder to upload to
+            mime_type: Optional MIME type (guessed from file_name if not provided)
+            progress_callback: Optional callable receiving the fraction uploaded (0.0-1.0)
+            app_properties: Optional private key/value properties to store on the file
+            
+        Returns:
+            Dictionary with the uploaded file's 'id'
         """
         file_metadata = {
             'name': file_name,
             'parents': [folder_id]
         }
+        if app_properties:
+            file_metadata['appProperties'] = app_properties
+        
+        if not mime_type:
+            mime_type = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
         
-        media = MediaFileUpload(file_path, mimetype=mime_type, resumable=True)
+        if isinstance(file_obj, (bytes, bytearray)):
+            file_obj = io.BytesIO(file_obj)
+        
+        size = file_obj.seek(0, os.SEEK_END)
+        file_obj.seek(0)
+        media = MediaIoBaseUpload(
+            file_obj,
+            mimetype=mime_type,
+            chunksize=self.UPLOAD_CHUNK_SIZE,
+            resumable=size > self.RESUMABLE_THRESHOLD
+        )
         
         try:
-            file = self.service.files().create(
+            request = self.service.files().create(
                 body=file_metadata,
                 media_body=media,
-                fields='id, name, webViewLink'
-            ).execute()
-            return file
+                fields='id'
+            )
+            return self._execute_upload(request, progress_callback)
         except HttpError as e:
             raise Exception(f"Error uploading file '{file_name}': {str(e)}")
     
+    def upload_files(self, jobs: List[Dict], max_workers: int = 4) -> List[Dict]:
+        """
+        Upload several files concurrently.
+        
+        Each worker thread sends its requests over its own HTTP transport, so the
+        uploads overlap their network time instead of running back to back.
+        
+        Args:
+            jobs: Keyword arguments for upload_stream (jobs with 'file_obj') or
+                upload_file (jobs with 'file_path'), one dict per file
+            max_workers: Maximum number of uploads in flight at once
+            
+        Returns:
+            Upload results, in the same order as jobs
+        """
+        self.ensure_fresh_token()
+        
+        def upload(job: Dict) -> Dict:
+            if 'file_obj' in job:
+                return self.upload_stream(**job)
+            return self.upload_file(**job)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(upload, jobs))
+    
     def verify_folder_access(self, folder_id: str) -> bool:
         """
         Verify that we can access a folder.
@@ -240,10 +464,11 @@ class DriveAPI:
             True if accessible, raises exception otherwise
         """
         try:
-            folder = self.service.files().get(
+            request = self.service.files().get(
                 fileId=folder_id,
-                fields='id, name, mimeType'
-            ).execute()
+                fields='mimeType'
+            )
+            folder = execute_with_retry(request)
             
             if folder.get('mimeType') != 'application/vnd.google-apps.folder':
                 raise Exception(f"ID {folder_id} is not a folder")
@@ -257,24 +482,82 @@ class DriveAPI:
                 raise Exception(f"Permission denied for folder {folder_id}.")
             raise Exception(f"Cannot access folder {folder_id}: {error_str}")
     
-    def setup_folder_structure(self, parent_folder_name: str, parent_folder_id: Optional[str] = None) -> Dict[str, str]:
+    def verify_folders(self, folder_ids: List[str]) -> Dict[str, bool]:
         """
-        Set up the required folder structure for the application.
+        Check that several folders exist and are accessible, using batched requests.
         
         Args:
-            parent_folder_name: Name of the parent folder
+            folder_ids: IDs of the folders to check
+            
+        Returns:
+            Dictionary mapping each folder ID to whether it is an accessible folder
+        """
+        return self.verify_files({
+            folder_id: 'application/vnd.google-apps.folder'
+            for folder_id in folder_ids
+        })
+    
+    def verify_files(self, expected_types: Dict[str, str]) -> Dict[str, bool]:
+        """
+        Check that several files exist, are not trashed and have the expected type,
+        using batched requests.
+        
+        Args:
+            expected_types: Mapping of file ID to its expected MIME type
+            
+        Returns:
+            Dictionary mapping each file ID to whether it is an accessible file of that type
+        """
+        results = {}
+        
+        def handle(request_id, response, exception):
+            results[request_id] = (
+                exception is None
+                and response.get('mimeType') == expected_types[request_id]
+                and not response.get('trashed', False)
+            )
+        
+        # Drive accepts up to 100 calls per batch, but large batches tend to fail
+        # with server errors, so stay at 25
+        file_ids = list(expected_types)
+        for start in range(0, len(file_ids), 25):
+            batch = self.service.new_batch_http_request(callback=handle)
+            for file_id in file_ids[start:start + 25]:
+                batch.add(
+                    self.service.files().get(fileId=file_id, fields='mimeType, trashed'),
+                    request_id=file_id
+                )
+            batch.execute()
+        
+        return results
+    
+    def resolve_parent_folder(self, parent_folder_name: str, parent_folder_id: Optional[str] = None) -> str:
+        """
+        Resolve the application's parent folder.
+        
+        Args:
+            parent_folder_name: Name of the parent folder (created if no ID is given)
             parent_folder_id: Optional ID of existing parent folder
             
         Returns:
-            Dictionary mapping folder names to their IDs
+            Parent folder ID
         """
         # Use existing parent folder or create new one
         if parent_folder_id:
             self.verify_folder_access(parent_folder_id)
-            parent_id = parent_folder_id
-        else:
-            parent_id = self.get_or_create_folder(parent_folder_name)
+            return parent_folder_id
+        return self.get_or_create_folder(parent_folder_name)
+    
+    def setup_subfolders(self, parent_id: str) -> Dict[str, str]:
+        """
+        Get or create the media and audio subfolders inside the parent folder.
         
+        Args:
+            parent_id: ID of the parent folder
+            
+        Returns:
+            Dictionary mapping folder names to their IDs, including 'parent'
+        """
         # Define subfolders
         subfolders = [
             'Images',
@@ -285,9 +568,32 @@ class DriveAPI:
         
         folder_ids = {'parent': parent_id}
         
-        # Create or get each subfolder
+        # Look up all existing subfolders at once, then create only the missing ones
+        existing = self.list_child_folders(parent_id)
         for subfolder in subfolders:
-            folder_id = self.get_or_create_folder(subfolder, parent_id)
+            folder_id = existing.get(subfolder) or self.create_folder(subfolder, parent_id)
             folder_ids[subfolder] = folder_id
         
         return folder_ids
+    
+    def setup_folder_structure(self, parent_folder_name: str, parent_folder_id: Optional[str] = None) -> Dict[str, str]:
+        """
+        Set up the required folder structure for the application.
+        
+        Args:
+            parent_folder_name: Name of the parent folder
+            parent_folder_id: Optional ID of existing parent folder
+            
+        Returns:
+            Dictionary mapping folder names to their IDs
+        """
+        cache_key = (parent_folder_name, parent_folder_id)
+        if cache_key not in self._structure_cache:
+            parent_id = self.resolve_parent_folder(parent_folder_name, parent_folder_id)
+            self._structure_cache[cache_key] = self.setup_subfolders(parent_id)
+        return dict(self._structure_cache[cache_key])
+    
+    def invalidate_structure_cache(self):
+        """Forget resolved folder structures (e.g. after the Drive layout was changed by hand)."""
+        self._structure_cache.clear()
+        self._folder_cache.clear()
@@ -3,14 +3,16 @@ Helper script to extract token data for Streamlit Cloud secrets.
 Run this after authenticating locally to get the token data.
 """
 
-import pickle
 import json
 
+from google_api_utils import load_credentials
+
 def get_token_data():
-    """Extract token data from token.pickle file."""
+    """Extract token data from token.json file."""
     try:
-        with open('token.pickle', 'rb') as token_file:
-            creds = pickle.load(token_file)
+        creds = load_credentials('token.json')
+        if creds is None:
+            raise FileNotFoundError('token.json')
         
         # Check for required scopes
         required_scopes = {
@@ -25,7 +27,7 @@ def get_token_data():
             print(f"   Missing: {missing}")
             print(f"   Current: {token_scopes}")
             print("\nYou need to re-authenticate:")
-            print("  1. Delete token.pickle")
+            print("  1. Delete token.json")
             print("  2. Run: streamlit run app.py")
             print("  3. Run this script again")
             print()
@@ -34,7 +36,7 @@ def get_token_data():
             print("⚠️  WARNING: Token has no refresh_token!")
             print("The deployed app will fail when the access token expires (~1 hour).")
             print("\nYou need to re-authenticate:")
-            print("  1. Delete token.pickle")
+            print("  1. Delete token.json")
             print("  2. Run: streamlit run app.py")
             print("  3. Run this script again")
             return None
@@ -65,7 +67,7 @@ def get_token_data():
         return token_data
         
     except FileNotFoundError:
-        print("ERROR: token.pickle not found!")
+        print("ERROR: token.json not found!")
         print("\nPlease run the app locally first to generate the token:")
         print("  streamlit run app.py")
         print("\nThen run this script again.")
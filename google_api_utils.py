@@ -0,0 +1,168 @@
+"""
+Shared helpers for the Google Drive and Sheets API clients.
+Provides thread-safe, connection-reusing HTTP transports for googleapiclient services.
+"""
+
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+import google_auth_httplib2
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, build_http
+
+
+# Retry policy for transient Google API failures (rate limiting and server errors)
+MAX_RETRIES = 5
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ThreadLocalHttp:
+    """
+    Hands out one authorized HTTP transport per thread.
+    
+    httplib2.Http is not thread-safe, but each instance keeps its connections
+    alive between requests. Giving every thread its own long-lived transport lets
+    concurrent uploads run safely while repeat calls on a thread reuse the
+    already-open TLS connection instead of paying a new handshake.
+    """
+    
+    def __init__(self, credentials):
+        """
+        Args:
+            credentials: google-auth credentials used to authorize every transport
+        """
+        self.credentials = credentials
+        self._local = threading.local()
+    
+    def get(self) -> google_auth_httplib2.AuthorizedHttp:
+        """Return the authorized HTTP transport owned by the calling thread."""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=build_http())
+            self._local.http = http
+        return http
+    
+    def build_request(self, http, *args, **kwargs) -> HttpRequest:
+        """requestBuilder hook: ignore the shared transport and use the calling thread's."""
+        return HttpRequest(self.get(), *args, **kwargs)
+
+
+def _is_rate_limited(error: HttpError) -> bool:
+    """Whether the request was rejected by quota (429, or 403 with a rate-limit reason)."""
+    status = error.resp.status
+    if status == 429:
+        return True
+    if status == 403:
+        content = error.content or b''
+        return b'rateLimitExceeded' in content or b'userRateLimitExceeded' in content
+    return False
+
+
+def execute_with_retry(request: HttpRequest, idempotent: bool = True, retries: int = MAX_RETRIES):
+    """
+    Execute a request, retrying transient failures with jittered exponential backoff.
+    
+    Args:
+        request: googleapiclient request to execute
+        idempotent: Whether the request is safe to repeat after a 5xx. A server error
+            may arrive after the write was applied, so creates and appends pass False
+            and are only retried when rate limited, where nothing was written
+        retries: Maximum number of retries after the first attempt
+        
+    Returns:
+        Response of the request
+    """
+    for attempt in range(retries + 1):
+        try:
+            return request.execute()
+        except HttpError as e:
+            retryable = _is_rate_limited(e) or (idempotent and e.resp.status in RETRYABLE_STATUSES)
+            if not retryable or attempt == retries:
+                raise
+            time.sleep(min(60, 2 ** attempt + random.random()))
+
+
+def load_credentials(token_path: str, scopes=None):
+    """
+    Load OAuth credentials saved by save_credentials.
+    
+    A legacy pickled token next to token_path (e.g. token.pickle for token.json)
+    is read once and rewritten as JSON, so existing installs keep their login.
+    
+    Args:
+        token_path: Path of the JSON token file
+        scopes: Optional scopes to request with the credentials
+        
+    Returns:
+        Credentials, or None if no saved token exists
+    """
+    if os.path.exists(token_path):
+        return Credentials.from_authorized_user_file(token_path, scopes)
+    
+    legacy_path = os.path.splitext(token_path)[0] + '.pickle'
+    if os.path.exists(legacy_path):
+        with open(legacy_path, 'rb') as token:
+            credentials = pickle.load(token)
+        save_credentials(credentials, token_path)
+        return credentials
+    
+    return None
+
+
+def save_credentials(credentials, token_path: str):
+    """
+    Persist OAuth credentials as authorized-user JSON.
+    
+    The token is written to a temporary file in the same directory and moved into
+    place with os.replace, so a crash mid-write never leaves a truncated token and
+    concurrent refreshes can't interleave their writes.
+    
+    Args:
+        credentials: google.oauth2.credentials.Credentials to save
+        token_path: Destination file (read back with load_credentials)
+    """
+    token_dir = os.path.dirname(os.path.abspath(token_path))
+    fd, temp_path = tempfile.mkstemp(dir=token_dir, prefix='.token-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as token:
+            token.write(credentials.to_json())
+        os.replace(temp_path, token_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def escape_query_value(value: str) -> str:
+    """Escape a string for use inside a single-quoted Drive search query literal."""
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+def build_service(service_name: str, version: str, credentials, http_pool: ThreadLocalHttp = None):
+    """
+    Build a googleapiclient service whose requests run on per-thread transports.
+    
+    Args:
+        service_name: API name, e.g. 'drive' or 'sheets'
+        version: API version, e.g. 'v3' or 'v4'
+        credentials: google-auth credentials
+        http_pool: Optional existing ThreadLocalHttp to share between services
+        
+    Returns:
+        googleapiclient Resource for the API
+    """
+    http_pool = http_pool or ThreadLocalHttp(credentials)
+    return build(
+        service_name,
+        version,
+        http=http_pool.get(),
+        requestBuilder=http_pool.build_request,
+        # Use the discovery document bundled with googleapiclient instead of fetching
+        # it; the legacy file cache only adds an import probe and a log warning
+        static_discovery=True,
+        cache_discovery=False
+    )
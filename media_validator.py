@@ -4,14 +4,96 @@ Handles validation of video and audio durations using ffmpeg-python.
 """
 
 import os
+import struct
 import subprocess
 import json
-from typing import Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import BinaryIO, Iterator, List, Tuple, Optional
+
+
+class _DurationUnavailable(Exception):
+    """Raised by _cached_duration so unreadable durations are not memoized."""
 
 
 class MediaValidator:
     """Class for validating media file durations."""
     
+    # Accepted extensions (lowercase, with the leading dot)
+    IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png'})
+    VIDEO_EXTENSIONS = frozenset({'.mp4'})
+    AUDIO_EXTENSIONS = frozenset({'.mp3', '.wav'})
+    
+    # file_type -> (allowed extensions, error message) for validate_media_extension
+    MEDIA_EXTENSION_RULES = {
+        'image': (IMAGE_EXTENSIONS, "Invalid image format. Allowed: .jpg, .jpeg, .png"),
+        'video': (VIDEO_EXTENSIONS, "Invalid video format. Only .mp4 is allowed")
+    }
+    
+    @staticmethod
+    def _iter_mp4_boxes(f: BinaryIO, end: int) -> Iterator[Tuple[bytes, int, int]]:
+        """
+        Walk the ISO-BMFF boxes between the current position and `end`.
+        
+        Yields:
+            Tuples of (box_type, payload_start, box_end); the file is positioned
+            at payload_start when each tuple is produced
+        """
+        while f.tell() + 8 <= end:
+            box_start = f.tell()
+            size, box_type = struct.unpack('>I4s', f.read(8))
+            if size == 1:
+                # 64-bit size follows the type
+                size = struct.unpack('>Q', f.read(8))[0]
+            elif size == 0:
+                # Box extends to the end of its container
+                size = end - box_start
+            box_end = box_start + size
+            if box_end < f.tell() or box_end > end:
+                return  # Corrupt size
+            yield box_type, f.tell(), box_end
+            f.seek(box_end)
+    
+    @staticmethod
+    def _get_mp4_duration(file_path: str) -> Optional[float]:
+        """
+        Read an MP4's duration from its movie header (moov/mvhd) without ffprobe.
+        
+        Args:
+            file_path: Path to the video file
+            
+        Returns:
+            Duration in seconds, or None if the header could not be found or parsed
+        """
+        try:
+            with open(file_path, 'rb') as f:
+                end = f.seek(0, os.SEEK_END)
+                f.seek(0)
+                for box_type, _, moov_end in MediaValidator._iter_mp4_boxes(f, end):
+                    if box_type != b'moov':
+                        continue
+                    for child_type, _, _ in MediaValidator._iter_mp4_boxes(f, moov_end):
+                        if child_type != b'mvhd':
+                            continue
+                        version = f.read(4)[0]  # version byte + 3 flag bytes
+                        if version == 1:
+                            f.seek(16, os.SEEK_CUR)  # 64-bit creation/modification times
+                            timescale, duration = struct.unpack('>IQ', f.read(12))
+                            unknown = 0xFFFFFFFFFFFFFFFF
+                        else:
+                            f.seek(8, os.SEEK_CUR)
+                            timescale, duration = struct.unpack('>II', f.read(8))
+                            unknown = 0xFFFFFFFF
+                        # Fragmented MP4s (e.g. MediaRecorder output) leave the movie
+                        # duration at 0 and keep the real length in their fragments
+                        if not timescale or duration in (0, unknown):
+                            return None
+                        return duration / timescale
+                    return None
+            return None
+        except (OSError, struct.error, IndexError):
+            return None
+    
     @staticmethod
     def _get_media_duration_ffprobe(file_path: str) -> Optional[float]:
         """
@@ -23,6 +105,26 @@ class MediaValidator:
         Returns:
             Duration in seconds, or None if error
         """
+        try:
+            return MediaValidator._probe_duration(file_path)
+        except FileNotFoundError:
+            # ffprobe not found
+            return None
+    
+    @staticmethod
+    def _probe_duration(file_path: str) -> Optional[float]:
+        """
+        Run ffprobe once to read the media duration.
+        
+        Args:
+            file_path: Path to the media file
+            
+        Returns:
+            Duration in seconds, or None if the file could not be probed
+            
+        Raises:
+            FileNotFoundError: If ffprobe is not installed
+        """
         try:
             # Use ffprobe to get duration
             cmd = [
@@ -51,14 +153,99 @@ class MediaValidator:
             
         except (subprocess.TimeoutExpired, subprocess.SubprocessError, json.JSONDecodeError, ValueError):
             return None
-        except FileNotFoundError:
-            # ffprobe not found
+    
+    @staticmethod
+    def _read_video_duration(file_path: str) -> Optional[float]:
+        """
+        Read a video's duration from the MP4 header, falling back to ffprobe.
+        
+        Args:
+            file_path: Path to the video file
+            
+        Returns:
+            Duration in seconds, or None if it could not be read
+            
+        Raises:
+            FileNotFoundError: If ffprobe is needed but not installed
+        """
+        # Parse the MP4 header in-process; ffprobe is only needed for files whose
+        # header can't be read that way
+        duration = MediaValidator._get_mp4_duration(file_path)
+        if duration is None:
+            duration = MediaValidator._probe_duration(file_path)
+        return duration
+    
+    @staticmethod
+    def _read_audio_duration(file_path: str) -> Optional[float]:
+        """
+        Read an audio file's duration with wave, mutagen or ffprobe, whichever works first.
+        
+        Args:
+            file_path: Path to the audio file
+            
+        Returns:
+            Duration in seconds, or None if it could not be read
+        """
+        # Try Python's wave module for WAV files (built-in, no dependencies)
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext == '.wav':
+            try:
+                import wave
+                with wave.open(file_path, 'rb') as wf:
+                    rate = wf.getframerate()
+                    if rate > 0:
+                        return wf.getnframes() / float(rate)
+            except Exception:
+                pass  # Fall through to other methods
+        
+        # Try mutagen (pure Python, handles MP3, WAV, and other formats); MP3s are
+        # opened with the MP3 class directly to skip File()'s format sniffing
+        try:
+            if ext == '.mp3':
+                from mutagen.mp3 import MP3
+                audio_file = MP3(file_path)
+            else:
+                from mutagen import File
+                audio_file = File(file_path)
+            if audio_file is not None:
+                return audio_file.info.length
+        except ImportError:
+            # Fallback to ffprobe if mutagen is not available
+            pass
+        except Exception:
+            # If mutagen fails, try ffprobe as fallback
+            pass
+        
+        # Fallback to ffprobe
+        return MediaValidator._get_media_duration_ffprobe(file_path)
+    
+    @staticmethod
+    def _get_duration(file_path: str, kind: str) -> Optional[float]:
+        """
+        Get a media duration, reusing the result while the file is unchanged.
+        
+        Args:
+            file_path: Path to the media file
+            kind: Either 'video' or 'audio'
+            
+        Returns:
+            Duration in seconds, or None if it could not be read
+            
+        Raises:
+            OSError: If the file can't be stat'ed
+            FileNotFoundError: If ffprobe is needed for a video but not installed
+        """
+        # Keying on mtime and size means a rewritten file is parsed again
+        st = os.stat(file_path)
+        try:
+            return _cached_duration(file_path, st.st_mtime_ns, st.st_size, kind)
+        except _DurationUnavailable:
             return None
     
     @staticmethod
     def validate_video_duration(file_path: str, min_seconds: float = 3.0, max_seconds: float = 10.0) -> Tuple[bool, Optional[str], Optional[float]]:
         """
-        Validate video duration using ffprobe.
+        Validate video duration from the MP4 header, falling back to ffprobe.
         
         Args:
             file_path: Path to the video file
@@ -68,23 +255,19 @@ class MediaValidator:
         Returns:
             Tuple of (is_valid, error_message, duration)
         """
-        # First check if ffprobe is available
         try:
-            subprocess.run(['ffprobe', '-version'], 
-                         stdout=subprocess.PIPE, 
-                         stderr=subprocess.PIPE,
-                         timeout=5)
-        except (FileNotFoundError, subprocess.TimeoutExpired):
-            return False, (
-                "ffprobe (part of ffmpeg) is not installed or not in PATH. "
-                "Please install ffmpeg:\n"
-                "- Windows: Download from https://ffmpeg.org/download.html or use 'choco install ffmpeg'\n"
-                "- Mac: brew install ffmpeg\n"
-                "- Linux: sudo apt-get install ffmpeg"
-            ), None
-        
-        try:
-            duration = MediaValidator._get_media_duration_ffprobe(file_path)
+            try:
+                duration = MediaValidator._get_duration(file_path, 'video')
+            except FileNotFoundError:
+                if not os.path.exists(file_path):
+                    raise
+                return False, (
+                    "ffprobe (part of ffmpeg) is not installed or not in PATH. "
+                    "Please install ffmpeg:\n"
+                    "- Windows: Download from https://ffmpeg.org/download.html or use 'choco install ffmpeg'\n"
+                    "- Mac: brew install ffmpeg\n"
+                    "- Linux: sudo apt-get install ffmpeg"
+                ), None
             
             if duration is None:
                 return False, "Could not read video duration. The file may be corrupted.", None
@@ -112,50 +295,8 @@ class MediaValidator:
         Returns:
             Tuple of (is_valid, error_message, duration)
         """
-        # Try Python's wave module for WAV files (built-in, no dependencies)
-        ext = os.path.splitext(file_path)[1].lower()
-        if ext == '.wav':
-            try:
-                import wave
-                with wave.open(file_path, 'rb') as wf:
-                    frames = wf.getnframes()
-                    rate = wf.getframerate()
-                    if rate > 0:
-                        duration = frames / float(rate)
-                        
-                        if duration < min_seconds:
-                            return False, f"Audio duration ({duration:.2f}s) is less than minimum ({min_seconds}s)", duration
-                        if duration > max_seconds:
-                            return False, f"Audio duration ({duration:.2f}s) exceeds maximum ({max_seconds}s)", duration
-                        
-                        return True, None, duration
-            except Exception:
-                pass  # Fall through to other methods
-        
-        # Try mutagen (pure Python, handles MP3, WAV, and other formats)
-        try:
-            from mutagen import File
-            
-            audio_file = File(file_path)
-            if audio_file is not None:
-                duration = audio_file.info.length
-                
-                if duration < min_seconds:
-                    return False, f"Audio duration ({duration:.2f}s) is less than minimum ({min_seconds}s)", duration
-                if duration > max_seconds:
-                    return False, f"Audio duration ({duration:.2f}s) exceeds maximum ({max_seconds}s)", duration
-                
-                return True, None, duration
-        except ImportError:
-            # Fallback to ffprobe if mutagen is not available
-            pass
-        except Exception:
-            # If mutagen fails, try ffprobe as fallback
-            pass
-        
-        # Fallback to ffprobe
         try:
-            duration = MediaValidator._get_media_duration_ffprobe(file_path)
+            duration = MediaValidator._get_duration(file_path, 'audio')
             
             if duration is None:
                 return False, (
@@ -173,6 +314,32 @@ class MediaValidator:
         except Exception as e:
             return False, f"Error reading audio file: {str(e)}", None
     
+    @staticmethod
+    def validate_batch(files: List[Tuple[str, str]], max_workers: Optional[int] = None) -> List[Tuple[bool, Optional[str], Optional[float]]]:
+        """
+        Validate the durations of several files concurrently, using the default limits.
+        
+        Probes are mostly file reads and ffprobe subprocesses, which release the GIL,
+        so threads are enough to overlap them.
+        
+        Args:
+            files: List of (file_path, kind) pairs, where kind is 'video' or 'audio'
+            max_workers: Maximum number of concurrent probes (defaults to the CPU count)
+            
+        Returns:
+            List of (is_valid, error_message, duration) tuples, in the same order as files
+        """
+        def validate(entry: Tuple[str, str]) -> Tuple[bool, Optional[str], Optional[float]]:
+            file_path, kind = entry
+            if kind == 'video':
+                return MediaValidator.validate_video_duration(file_path)
+            if kind == 'audio':
+                return MediaValidator.validate_audio_duration(file_path)
+            return False, f"Unknown file type: {kind}", None
+        
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            return list(executor.map(validate, files))
+    
     @staticmethod
     def validate_media_file(file_path: str, file_type: str) -> Tuple[bool, Optional[str]]:
         """
@@ -185,21 +352,36 @@ class MediaValidator:
         Returns:
             Tuple of (is_valid, error_message)
         """
-        if not os.path.exists(file_path):
+        # The extension check is pure string work, so do it before touching disk
+        is_valid, error_msg = MediaValidator.validate_media_extension(file_path, file_type)
+        if not is_valid:
+            return is_valid, error_msg
+        
+        if not os.path.isfile(file_path):
             return False, "File does not exist"
         
-        ext = os.path.splitext(file_path)[1].lower()
+        return True, None
+    
+    @staticmethod
+    def validate_media_extension(file_name: str, file_type: str) -> Tuple[bool, Optional[str]]:
+        """
+        Validate a media file's extension from its name alone, without touching disk.
         
-        if file_type == 'image':
-            valid_extensions = ['.jpg', '.jpeg', '.png']
-            if ext not in valid_extensions:
-                return False, f"Invalid image format. Allowed: {', '.join(valid_extensions)}"
-        elif file_type == 'video':
-            if ext != '.mp4':
-                return False, "Invalid video format. Only .mp4 is allowed"
-        else:
+        Args:
+            file_name: File name or path
+            file_type: Either 'image' or 'video'
+            
+        Returns:
+            Tuple of (is_valid, error_message)
+        """
+        rule = MediaValidator.MEDIA_EXTENSION_RULES.get(file_type)
+        if rule is None:
             return False, f"Unknown file type: {file_type}"
         
+        allowed, error_msg = rule
+        if os.path.splitext(file_name)[1].lower() not in allowed:
+            return False, error_msg
+        
         return True, None
     
     @staticmethod
@@ -213,11 +395,48 @@ class MediaValidator:
         Returns:
             Tuple of (is_valid, error_message)
         """
-        if not os.path.exists(file_path):
+        is_valid, error_msg = MediaValidator.validate_audio_extension(file_path)
+        if not is_valid:
+            return is_valid, error_msg
+        
+        if not os.path.isfile(file_path):
             return False, "File does not exist"
         
-        ext = os.path.splitext(file_path)[1].lower()
-        if ext not in ['.mp3', '.wav']:
+        return True, None
+    
+    @staticmethod
+    def validate_audio_extension(file_name: str) -> Tuple[bool, Optional[str]]:
+        """
+        Validate an audio file's extension from its name alone, without touching disk.
+        
+        Args:
+            file_name: File name or path
+            
+        Returns:
+            Tuple of (is_valid, error_message)
+        """
+        ext = os.path.splitext(file_name)[1].lower()
+        if ext not in MediaValidator.AUDIO_EXTENSIONS:
             return False, "Invalid audio format. Allowed: .mp3, .wav"
         
         return True, None
+
+
+@lru_cache(maxsize=2048)
+def _cached_duration(file_path: str, mtime_ns: int, size: int, kind: str) -> Optional[float]:
+    """
+    Parse a media duration once per (path, mtime, size); see MediaValidator._get_duration.
+    
+    Failures are raised rather than returned, since lru_cache doesn't cache exceptions:
+    a transient ffprobe timeout is retried on the next call instead of sticking.
+    
+    Raises:
+        _DurationUnavailable: If the duration could not be read
+    """
+    if kind == 'video':
+        duration = MediaValidator._read_video_duration(file_path)
+    else:
+        duration = MediaValidator._read_audio_duration(file_path)
+    if duration is None:
+        raise _DurationUnavailable(file_path)
+    return duration
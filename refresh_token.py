@@ -4,16 +4,18 @@ Run this script when your deployed app shows "Token expired" error.
 It will refresh your token and show you the new data to paste into Streamlit secrets.
 """
 
-import pickle
 import json
 from google.auth.transport.requests import Request
 
+from google_api_utils import load_credentials, save_credentials
+
 def refresh_token():
     """Refresh the OAuth token and display new credentials."""
     try:
         # Load existing token
-        with open('token.pickle', 'rb') as token_file:
-            creds = pickle.load(token_file)
+        creds = load_credentials('token.json')
+        if creds is None:
+            raise FileNotFoundError('token.json')
         
         print("Current token status:")
         print(f"  Valid: {creds.valid}")
@@ -24,7 +26,7 @@ def refresh_token():
             print("\n❌ No refresh token available!")
             print("\nYour token was created without a refresh token.")
             print("You need to re-authenticate to get one:")
-            print("  1. Delete token.pickle")
+            print("  1. Delete token.json")
             print("  2. Run: streamlit run app.py")
             print("  3. Complete OAuth authentication (a browser window will open)")
             print("  4. Run: python get_token_for_secrets.py")
@@ -39,8 +41,7 @@ def refresh_token():
             creds.refresh(Request())
             
             # Save refreshed token
-            with open('token.pickle', 'wb') as token_file:
-                pickle.dump(creds, token_file)
+            save_credentials(creds, 'token.json')
             
             print("✅ Token refreshed successfully!")
         
@@ -74,13 +75,13 @@ def refresh_token():
         print("5. Restart your app")
         
     except FileNotFoundError:
-        print("❌ ERROR: token.pickle not found!")
+        print("❌ ERROR: token.json not found!")
         print("\nPlease run the app locally first:")
         print("  streamlit run app.py")
     except Exception as e:
         print(f"❌ ERROR: {str(e)}")
         print("\nYou may need to re-authenticate:")
-        print("  1. Delete token.pickle")
+        print("  1. Delete token.json")
         print("  2. Run: streamlit run app.py")
 
 if __name__ == "__main__":
@@ -4,15 +4,21 @@ Handles reading from and writing to Google Sheets.
 Works with both local token files and Streamlit secrets.
 """
 
-import os
-import json
-import pickle
+import re
 from typing import Optional, List, Dict
 from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from google.oauth2.credentials import Credentials
 from googleapiclient.errors import HttpError
 
+from google_api_utils import (
+    ThreadLocalHttp,
+    build_service,
+    escape_query_value,
+    execute_with_retry,
+    load_credentials,
+    save_credentials
+)
+
 
 class SheetsAPI:
     """Wrapper class for Google Sheets API operations using OAuth."""
@@ -22,7 +28,22 @@ class SheetsAPI:
         'https://www.googleapis.com/auth/spreadsheets'
     ]
     
-    def __init__(self, credentials_path: str = None, token_path: str = 'token.pickle',
+    # Drive search for a spreadsheet by exact name; fill {name} with an escaped value
+    SPREADSHEET_QUERY = "name='{name}' and mimeType='application/vnd.google-apps.spreadsheet' and trashed=false"
+    
+    # Row ID formats per mode, e.g. "img_123", matched one ID per line of a
+    # newline-joined column; group 1 is the number
+    ID_PATTERNS = {
+        'Image': re.compile(r'^[ \t]*img_(\d+)[ \t]*$', re.MULTILINE),
+        'Video': re.compile(r'^[ \t]*vid_(\d+)[ \t]*$', re.MULTILINE)
+    }
+    
+    # Hidden tab whose formula cells keep each tab's max ID number, so get_max_id
+    # reads one cell instead of the whole ID column
+    META_SHEET = 'Meta'
+    MAX_ID_CELLS = {'Image': 'B1', 'Video': 'B2'}
+    
+    def __init__(self, credentials_path: str = None, token_path: str = 'token.json',
                  credentials_dict: Dict = None, token_dict: Dict = None):
         """
         Initialize Sheets API client with OAuth.
@@ -37,7 +58,14 @@ class SheetsAPI:
         self.token_path = token_path
         self.credentials_dict = credentials_dict
         self.token_dict = token_dict
+        self.credentials = None
+        self.http_pool = None
+        self._drive_service = None
+        self._spreadsheet_cache = {}  # spreadsheet name -> spreadsheet ID
         self.service = self._authenticate()
+        # Resource wrappers are rebuilt on every attribute call, so keep the ones used per request
+        self._spreadsheets = self.service.spreadsheets()
+        self._values = self._spreadsheets.values()
     
     def _authenticate(self):
         """Authenticate using OAuth and return Sheets service object."""
@@ -47,15 +75,13 @@ class SheetsAPI:
         if self.token_dict:
             try:
                 # Token provided as dict from Streamlit secrets
-                from google.oauth2.credentials import Credentials
                 creds = Credentials.from_authorized_user_info(self.token_dict, self.SCOPES)
             except Exception as e:
                 raise Exception(f"Failed to load credentials from secrets: {str(e)}")
         # Try loading from file (local development)
-        elif os.path.exists(self.token_path):
+        elif self.token_path:
             try:
-                with open(self.token_path, 'rb') as token:
-                    creds = pickle.load(token)
+                creds = load_credentials(self.token_path, self.SCOPES)
             except Exception as e:
                 raise Exception(f"Failed to load token from file: {str(e)}")
         
@@ -66,8 +92,7 @@ class SheetsAPI:
                     creds.refresh(Request())
                     # Save refreshed token
                     if self.token_path and not self.token_dict:
-                        with open(self.token_path, 'wb') as token:
-                            pickle.dump(creds, token)
+                        save_credentials(creds, self.token_path)
                 except Exception as e:
                     # If refresh fails in deployment, raise clear error with details
                     if self.token_dict:
@@ -87,7 +112,15 @@ class SheetsAPI:
                     )
                 raise Exception("Not authenticated. Please initialize DriveAPI first.")
         
-        return build('sheets', 'v4', credentials=creds)
+        self.credentials = creds
+        self.http_pool = ThreadLocalHttp(creds)
+        return build_service('sheets', 'v4', creds, self.http_pool)
+    
+    def _get_drive_service(self):
+        """Return a Drive service sharing this client's credentials and transports, built on first use."""
+        if self._drive_service is None:
+            self._drive_service = build_service('drive', 'v3', self.credentials, self.http_pool)
+        return self._drive_service
     
     def find_spreadsheet_by_name(self, spreadsheet_name: str) -> Optional[str]:
         """
@@ -99,34 +132,34 @@ class SheetsAPI:
         Returns:
             Spreadsheet ID if found, None otherwise
         """
-        # Get credentials from the token
-        creds = None
-        if self.token_dict:
-            from google.oauth2.credentials import Credentials
-            creds = Credentials.from_authorized_user_info(self.token_dict, self.SCOPES)
-        elif os.path.exists(self.token_path):
-            with open(self.token_path, 'rb') as token:
-                creds = pickle.load(token)
-        
-        if not creds:
-            raise Exception("Not authenticated. Please initialize DriveAPI first.")
+        if spreadsheet_name in self._spreadsheet_cache:
+            return self._spreadsheet_cache[spreadsheet_name]
         
-        drive_service = build('drive', 'v3', credentials=creds)
-        query = f"name='{spreadsheet_name}' and mimeType='application/vnd.google-apps.spreadsheet' and trashed=false"
+        drive_service = self._get_drive_service()
+        query = self.SPREADSHEET_QUERY.format(name=escape_query_value(spreadsheet_name))
         
         try:
-            results = drive_service.files().list(
+            request = drive_service.files().list(
                 q=query,
-                fields="files(id, name)"
-            ).execute()
+                fields="files(id)",
+                spaces='drive',
+                corpora='user',
+                pageSize=1
+            )
+            results = execute_with_retry(request)
             
             files = results.get('files', [])
             if files:
+                self._spreadsheet_cache[spreadsheet_name] = files[0]['id']
                 return files[0]['id']
             return None
         except HttpError as e:
             raise Exception(f"Error searching for spreadsheet: {str(e)}")
     
+    def invalidate_spreadsheet_cache(self):
+        """Forget all remembered spreadsheet IDs (e.g. after a spreadsheet was deleted)."""
+        self._spreadsheet_cache.clear()
+    
     def create_spreadsheet(self, spreadsheet_name: str, parent_folder_id: Optional[str] = None) -> str:
         """
         Create a new spreadsheet with the required tabs and headers.
@@ -138,7 +171,16 @@ class SheetsAPI:
         Returns:
             Spreadsheet ID
         """
-        # Create spreadsheet
+        # Header row for both media tabs and the max-ID formulas, written as part of
+        # creating the tabs instead of in a follow-up values write
+        headers = ['id', 'file_link', 'msa_caption', 'sudanese_caption', 'audio_file_link', 'category', 'uploaded_by']
+        meta_rows = [
+            ['max_image_id', self._max_id_formula('Images', 'img_')],
+            ['max_video_id', self._max_id_formula('Videos', 'vid_')]
+        ]
+        
+        # Create spreadsheet; sheet IDs are fixed so cells can be addressed before the
+        # create response is known
         spreadsheet_body = {
             'properties': {
                 'title': spreadsheet_name
@@ -146,69 +188,150 @@ class SheetsAPI:
             'sheets': [
                 {
                     'properties': {
+                        'sheetId': 0,
                         'title': 'Images',
                         'gridProperties': {
                             'rowCount': 1000,
                             'columnCount': 7
                         }
-                    }
+                    },
+                    'data': [self._grid_data([headers])]
                 },
                 {
                     'properties': {
+                        'sheetId': 1,
                         'title': 'Videos',
                         'gridProperties': {
                             'rowCount': 1000,
                             'columnCount': 7
                         }
-                    }
+                    },
+                    'data': [self._grid_data([headers])]
+                },
+                {
+                    'properties': {
+                        'sheetId': 2,
+                        'title': self.META_SHEET,
+                        'hidden': True,
+                        'gridProperties': {
+                            'rowCount': 2,
+                            'columnCount': 2
+                        }
+                    },
+                    'data': [self._grid_data(meta_rows)]
                 }
             ]
         }
         
         try:
-            spreadsheet = self.service.spreadsheets().create(
-                body=spreadsheet_body,
-                fields='spreadsheetId'
-            ).execute()
-            spreadsheet_id = spreadsheet.get('spreadsheetId')
-            
-            # Set headers for both sheets
-            headers = ['id', 'file_link', 'msa_caption', 'sudanese_caption', 'audio_file_link', 'category', 'uploaded_by']
-            self.append_row(spreadsheet_id, 'Images', headers)
-            self.append_row(spreadsheet_id, 'Videos', headers)
-            
-            # Move to parent folder if specified
             if parent_folder_id:
-                creds = None
-                if self.token_dict:
-                    from google.oauth2.credentials import Credentials
-                    creds = Credentials.from_authorized_user_info(self.token_dict, self.SCOPES)
-                elif os.path.exists(self.token_path):
-                    with open(self.token_path, 'rb') as token:
-                        creds = pickle.load(token)
-                
-                if not creds:
-                    raise Exception("Not authenticated. Please initialize DriveAPI first.")
-                
-                drive_service = build('drive', 'v3', credentials=creds)
-                
-                file = drive_service.files().get(
-                    fileId=spreadsheet_id,
-                    fields='parents'
-                ).execute()
-                
-                previous_parents = ",".join(file.get('parents', []))
-                drive_service.files().update(
-                    fileId=spreadsheet_id,
-                    addParents=parent_folder_id,
-                    removeParents=previous_parents,
-                    fields='id, parents'
-                ).execute()
+                spreadsheet_id = self._create_in_folder(spreadsheet_body, parent_folder_id)
+            else:
+                request = self._spreadsheets.create(
+                    body=spreadsheet_body,
+                    fields='spreadsheetId'
+                )
+                spreadsheet = execute_with_retry(request, idempotent=False)
+                spreadsheet_id = spreadsheet.get('spreadsheetId')
             
+            self._spreadsheet_cache[spreadsheet_name] = spreadsheet_id
             return spreadsheet_id
         except HttpError as e:
             raise Exception(f"Error creating spreadsheet: {str(e)}")
     
+    def _create_in_folder(self, spreadsheet_body: Dict, parent_folder_id: str) -> str:
+        """
+        Create a spreadsheet directly inside a Drive folder, then give it the requested tabs.
+        
+        Creating through Drive with the parent set replaces the Sheets create followed by
+        a parents lookup and a move.
+        
+        Args:
+            spreadsheet_body: Sheets create body ('properties' and 'sheets', with sheet IDs
+                set and optional initial 'data')
+            parent_folder_id: Folder to create the spreadsheet in
+            
+        Returns:
+            Spreadsheet ID
+        """
+        request = self._get_drive_service().files().create(
+            body={
+                'name': spreadsheet_body['properties']['title'],
+                'mimeType': 'application/vnd.google-apps.spreadsheet',
+                'parents': [parent_folder_id]
+            },
+            fields='id'
+        )
+        spreadsheet_id = execute_with_retry(request, idempotent=False)['id']
+        
+        # A new spreadsheet starts with one default tab (sheetId 0): turn it into the
+        # first requested tab, add the others, then fill in their initial cells
+        first_sheet, *other_sheets = spreadsheet_body['sheets']
+        requests = [{
+            'updateSheetProperties': {
+                'properties': first_sheet['properties'],
+                'fields': 'title,gridProperties.rowCount,gridProperties.columnCount'
+            }
+        }]
+        requests += [{'addSheet': {'properties': sheet['properties']}} for sheet in other_sheets]
+        for sheet in spreadsheet_body['sheets']:
+            for grid in sheet.get('data', []):
+                requests.append({
+                    'updateCells': {
+                        'start': {
+                            'sheetId': sheet['properties']['sheetId'],
+                            'rowIndex': grid['startRow'],
+                            'columnIndex': grid['startColumn']
+                        },
+                        'rows': grid['rowData'],
+                        'fields': 'userEnteredValue'
+                    }
+                })
+        
+        request = self._spreadsheets.batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={'requests': requests}
+        )
+        try:
+            execute_with_retry(request, idempotent=False)
+        except Exception:
+            # Don't leave a tab-less spreadsheet behind under this name: the next lookup
+            # would find it and every append would fail
+            try:
+                execute_with_retry(self._get_drive_service().files().delete(fileId=spreadsheet_id))
+            except Exception:
+                pass  # Best effort; the original error is more useful
+            raise
+        
+        return spreadsheet_id
+    
+    @staticmethod
+    def _grid_data(rows: List[List[str]]) -> Dict:
+        """
+        Build Sheets GridData starting at A1 from rows of strings.
+        
+        Values starting with '=' are entered as formulas, everything else as text.
+        """
+        return {
+            'startRow': 0,
+            'startColumn': 0,
+            'rowData': [
+                {'values': [
+                    {'userEnteredValue': {'formulaValue' if value.startswith('=') else 'stringValue': value}}
+                    for value in row
+                ]}
+                for row in rows
+            ]
+        }
+    
+    @staticmethod
+    def _max_id_formula(sheet_name: str, prefix: str) -> str:
+        """Sheets formula giving the largest <prefix><number> ID in a tab's ID column (0 if none)."""
+        return (
+            f'=MAX(0, ARRAYFORMULA(IFERROR(VALUE(REGEXEXTRACT('
+            f'{sheet_name}!A2:A, "^\\s*{prefix}(\\d+)\\s*$")), 0)))'
+        )
+    
     def get_or_create_spreadsheet(self, spreadsheet_name: str, parent_folder_id: Optional[str] = None) -> str:
         """
         Get existing spreadsheet or create if it doesn't exist.
@@ -225,7 +348,9 @@ class SheetsAPI:
             return spreadsheet_id
         return self.create_spreadsheet(spreadsheet_name, parent_folder_id)
     
-    def read_sheet(self, spreadsheet_id: str, sheet_name: str, range_name: Optional[str] = None) -> List[List]:
+    def read_sheet(self, spreadsheet_id: str, sheet_name: str, range_name: Optional[str] = None,
+                   major_dimension: str = 'ROWS', value_render_option: str = 'FORMATTED_VALUE',
+                   date_time_render_option: str = 'SERIAL_NUMBER') -> List[List]:
         """
         Read data from a sheet.
         
@@ -233,9 +358,13 @@ class SheetsAPI:
             spreadsheet_id: ID of the spreadsheet
             sheet_name: Name of the sheet tab
             range_name: Optional range (e.g., 'A1:Z100'), defaults to entire sheet
+            major_dimension: 'ROWS' (default) or 'COLUMNS' to get one list per column
+            value_render_option: 'FORMATTED_VALUE' (default), 'UNFORMATTED_VALUE' or 'FORMULA'
+            date_time_render_option: 'SERIAL_NUMBER' (default) or 'FORMATTED_STRING'; only
+                used when values are not rendered as FORMATTED_VALUE
             
         Returns:
-            List of rows (each row is a list of values)
+            List of rows (each row is a list of values), or of columns for 'COLUMNS'
         """
         if range_name:
             range_str = f"{sheet_name}!{range_name}"
@@ -243,10 +372,15 @@ class SheetsAPI:
             range_str = sheet_name
         
         try:
-            result = self.service.spreadsheets().values().get(
+            request = self._values.get(
                 spreadsheetId=spreadsheet_id,
-                range=range_str
-            ).execute()
+                range=range_str,
+                majorDimension=major_dimension,
+                valueRenderOption=value_render_option,
+                dateTimeRenderOption=date_time_render_option,
+                fields='values'
+            )
+            result = execute_with_retry(request)
             return result.get('values', [])
         except HttpError as e:
             raise Exception(f"Error reading sheet: {str(e)}")
@@ -263,23 +397,68 @@ class SheetsAPI:
         Returns:
             Update response
         """
+        return self.append_rows(spreadsheet_id, sheet_name, [row_data])
+    
+    def append_rows(self, spreadsheet_id: str, sheet_name: str, rows: List[List]) -> Dict:
+        """
+        Append several rows to a sheet in a single API call.
+        
+        Args:
+            spreadsheet_id: ID of the spreadsheet
+            sheet_name: Name of the sheet tab
+            rows: List of rows (each row is a list of values)
+            
+        Returns:
+            Update response, trimmed to the updated range and row count
+        """
         range_name = f"{sheet_name}!A:A"
         
         value_input_option = 'USER_ENTERED'
         body = {
-            'values': [row_data]
+            'values': rows
         }
         
         try:
-            result = self.service.spreadsheets().values().append(
+            request = self._values.append(
                 spreadsheetId=spreadsheet_id,
                 range=range_name,
                 valueInputOption=value_input_option,
-                body=body
-            ).execute()
+                insertDataOption='INSERT_ROWS',
+                body=body,
+                fields='updates(updatedRange,updatedRows)'
+            )
+            result = execute_with_retry(request, idempotent=False)
             return result
         except HttpError as e:
-            raise Exception(f"Error appending row: {str(e)}")
+            raise Exception(f"Error appending rows: {str(e)}")
+    
+    def update_ranges(self, spreadsheet_id: str, data: Dict[str, List[List]]) -> Dict:
+        """
+        Write values to several ranges, possibly on different tabs, in a single API call.
+        
+        Args:
+            spreadsheet_id: ID of the spreadsheet
+            data: Mapping of A1 range (e.g. 'Images!A1') to the rows to write there
+            
+        Returns:
+            Update response
+        """
+        body = {
+            'valueInputOption': 'USER_ENTERED',
+            'data': [
+                {'range': range_name, 'values': rows}
+                for range_name, rows in data.items()
+            ]
+        }
+        
+        try:
+            request = self._values.batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body=body
+            )
+            return execute_with_retry(request)
+        except HttpError as e:
+            raise Exception(f"Error updating ranges: {str(e)}")
     
     def get_max_id(self, spreadsheet_id: str, mode: str) -> int:
         """
@@ -292,25 +471,29 @@ class SheetsAPI:
         Returns:
             Maximum ID number found (0 if no IDs exist)
         """
-        sheet_name = 'Images' if mode == 'Image' else 'Videos'
-        rows = self.read_sheet(spreadsheet_id, sheet_name)
+        kind = 'Image' if mode == 'Image' else 'Video'
         
-        if len(rows) <= 1:  # Only headers or empty
-            return 0
+        # Spreadsheets created by this app keep the max in a formula cell on the Meta tab
+        try:
+            values = self.read_sheet(spreadsheet_id, self.META_SHEET, self.MAX_ID_CELLS[kind],
+                                     value_render_option='UNFORMATTED_VALUE')
+            return int(values[0][0])
+        except Exception:
+            # No Meta tab (older spreadsheet) or an unexpected value: scan the IDs instead
+            pass
         
-        max_id = 0
-        prefix = 'img_' if mode == 'Image' else 'vid_'
+        sheet_name = 'Images' if kind == 'Image' else 'Videos'
+        pattern = self.ID_PATTERNS[kind]
         
-        # Skip header row (index 0)
-        for row in rows[1:]:
-            if row and len(row) > 0:
-                id_str = str(row[0]).strip()
-                if id_str.startswith(prefix):
-                    try:
-                        # Extract number from id_str (e.g., "img_123" -> 123)
-                        num = int(id_str.split('_')[1])
-                        max_id = max(max_id, num)
-                    except (ValueError, IndexError):
-                        continue
+        # Only the ID column below the header, as a single list; unformatted, so
+        # numbers and dates come back as numbers and are skipped without a str()
+        columns = self.read_sheet(spreadsheet_id, sheet_name, 'A2:A', major_dimension='COLUMNS',
+                                  value_render_option='UNFORMATTED_VALUE')
+        if not columns:
+            return 0
         
-        return max_id
+        # Sweep the whole column in one regex pass and extract the number from each
+        # matching ID (e.g., "img_123" -> 123); multi-line cells are skipped so a line
+        # inside one can't pass for a whole cell
+        blob = '\n'.join(value for value in columns[0] if isinstance(value, str) and '\n' not in value)
+        return max((int(m.group(1)) for m in pattern.finditer(blob)), default=0)